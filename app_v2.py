@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import os
+import shutil
 import time
 from datetime import datetime
 from src.background_processor import get_processor, shutdown_processor
@@ -74,13 +75,15 @@ def main():
                 # Save uploaded file permanently in data/uploads directory
                 file_path = os.path.join(uploads_dir, uploaded_file.name)
                 with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getvalue())
+                    uploaded_file.seek(0)
+                    shutil.copyfileobj(uploaded_file, f)
                 
                 try:
                     doc_id = processor.queue_document(
                         file_path, 
                         uploaded_file.name,
-                        progress_callback=progress_callback
+                        progress_callback=progress_callback,
+                        priority='interactive'
                     )
                     st.success(f"Document queued with ID: {doc_id}")
                     st.session_state.selected_doc_id = doc_id
@@ -169,9 +172,9 @@ def main():
         
         with col4:
             # Quick stats preview
-            embeddings_df = processor.get_embeddings_df(doc_id)
-            if not embeddings_df.empty and 'token_count' in embeddings_df.columns:
-                total_tokens = embeddings_df['token_count'].sum()
+            token_df = processor.get_embeddings_df(doc_id, columns=['token_count'])
+            if not token_df.empty:
+                total_tokens = token_df['token_count'].sum()
                 if total_tokens > 1000000:
                     st.markdown(f"**{total_tokens/1000000:.1f}M** tokens")
                 elif total_tokens > 1000:
@@ -199,10 +202,10 @@ def main():
             st.divider()
             st.subheader("🔬 Methodology Evaluation")
             
-            # Load embeddings
-            embeddings_df = processor.get_embeddings_df(doc_id)
+            # Load chunk statistics (text and embeddings are loaded on demand)
+            chunks_df = processor.get_embeddings_df(doc_id, columns=['token_count'])
             
-            if embeddings_df.empty:
+            if chunks_df.empty:
                 st.error("No embeddings found for this document")
             else:
                 # Evaluation Document Metrics
@@ -210,17 +213,15 @@ def main():
                     col_stats1, col_stats2, col_stats3 = st.columns(3)
                     
                     with col_stats1:
-                        st.metric("Total Chunks", len(embeddings_df))
+                        st.metric("Total Chunks", len(chunks_df))
                     with col_stats2:
-                        if 'token_count' in embeddings_df.columns:
-                            st.metric("Avg Tokens/Chunk", f"{embeddings_df['token_count'].mean():.0f}")
+                        st.metric("Avg Tokens/Chunk", f"{chunks_df['token_count'].mean():.0f}")
                     with col_stats3:
-                        if 'token_count' in embeddings_df.columns:
-                            total_tokens = embeddings_df['token_count'].sum()
-                            if total_tokens > 1000000:
-                                st.metric("Total Tokens", f"{total_tokens/1000000:.1f}M")
-                            else:
-                                st.metric("Total Tokens", f"{total_tokens:,}")
+                        total_tokens = chunks_df['token_count'].sum()
+                        if total_tokens > 1000000:
+                            st.metric("Total Tokens", f"{total_tokens/1000000:.1f}M")
+                        else:
+                            st.metric("Total Tokens", f"{total_tokens:,}")
                 
                 # Main Q&A interface
                 col1, col2 = st.columns([3, 1])
@@ -244,9 +245,11 @@ def main():
                         if query.strip():
                             # Generate all three answers simultaneously
                             with st.spinner("Generating RAG, Non-RAG, and Hybrid answers..."):
+                                retrieval_index = processor.get_retrieval_index(doc_id)
+                                
                                 rag_result = rag_chain.answer_question(
                                     query, 
-                                    embeddings_df,
+                                    retrieval_index,
                                     top_k=5,
                                     include_neighbors=True
                                 )
@@ -255,7 +258,7 @@ def main():
                                 
                                 hybrid_result = rag_chain.generate_hybrid_answer(
                                     query,
-                                    embeddings_df,
+                                    retrieval_index,
                                     top_k=5,
                                     include_neighbors=True
                                 )
@@ -274,11 +277,13 @@ def main():
                 
                 with col2:
                     st.subheader("📊 Retrieval Analysis")
-                    if len(embeddings_df) > 0:
-                        sample_chunks = embeddings_df.head(3)
+                    if len(chunks_df) > 0:
+                        sample_chunks = chunks_df.head(3)
+                        sample_texts = processor.get_chunk_texts(doc_id, sample_chunks['chunk_id'].tolist())
                         for idx, row in sample_chunks.iterrows():
+                            text = sample_texts.get(row['chunk_id'], '')
                             with st.expander(f"Chunk {row['chunk_id']} ({row.get('token_count', '?')} tokens)"):
-                                preview_text = row['text'][:200] + "..." if len(row['text']) > 200 else row['text']
+                                preview_text = text[:200] + "..." if len(text) > 200 else text
                                 st.text(preview_text)
         
         # Display methodology comparison results if available
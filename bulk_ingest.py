@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Headless bulk ingestion of PDF collections.
+
+Walks directories (and/or reads manifests listing one PDF path per line),
+skips files whose content hash is already processed, and queues the rest as
+bulk jobs on a BackgroundProcessor. Prints throughput while the pipeline
+drains and a summary at the end.
+
+Jobs live in the durable job queue, so an interrupted run resumes where it
+left off when started again with the same arguments.
+
+Usage:
+    python bulk_ingest.py data/pdfs/ --workers 4
+    python bulk_ingest.py --manifest seed_files.txt --interval 30
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Dict, Iterator, List
+from src.background_processor import BackgroundProcessor
+import config
+
+def iter_pdf_paths(directories: List[str], manifests: List[str]) -> Iterator[str]:
+    """
+    Yield PDF paths from directory trees and manifest files.
+    
+    Args:
+        directories: Directories searched recursively for *.pdf files
+        manifests: Text files with one path per line ('#' starts a comment);
+            relative paths are resolved against the manifest's directory
+    
+    Yields:
+        Absolute file paths, in sorted order within each directory
+    """
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith('.pdf'):
+                    yield os.path.abspath(os.path.join(root, name))
+    
+    for manifest in manifests:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            for line in f:
+                path = line.split('#', 1)[0].strip()
+                if path:
+                    yield os.path.abspath(os.path.join(base, path))
+
+def format_rate(count: float, seconds: float) -> str:
+    return f"{count / seconds:,.1f}" if seconds > 0 else "-"
+
+def ingest(paths: Iterator[str], workers: int, priority: str, interval: float) -> int:
+    """
+    Queue PDFs for processing and wait until every one is finished.
+    
+    Args:
+        paths: PDF file paths
+        workers: Ingest worker threads
+        priority: Job priority class
+        interval: Seconds between progress lines
+    
+    Returns:
+        int: Number of documents that failed (or could not be queued)
+    """
+    processor = BackgroundProcessor(max_workers=workers)
+    db = processor.db
+    completed_hashes = {doc['file_hash'] for doc in db.get_documents('completed')}
+    
+    counts = {'found': 0, 'skipped': 0, 'duplicates': 0}
+    queued: Dict[int, str] = {}
+    seen_hashes = set()
+    errors = []
+    totals = {'pages': 0, 'chunks': 0, 'tokens': 0}
+    finished: Dict[int, str] = {}
+    start = time.time()
+    last_report = start
+    
+    def collect_finished():
+        """Record newly finished documents and add their output to the totals."""
+        outstanding = [doc_id for doc_id in queued if doc_id not in finished]
+        statuses = db.get_documents_by_ids(outstanding)
+        for doc_id in outstanding:
+            doc = statuses.get(doc_id)
+            if doc is None:
+                # Deleted while queued or processing (e.g. from the app)
+                finished[doc_id] = 'deleted'
+                continue
+            if doc['status'] not in ('completed', 'failed'):
+                continue
+            
+            finished[doc_id] = doc['status']
+            if doc['status'] == 'completed':
+                totals['pages'] += doc['num_pages'] or 0
+                totals['chunks'] += doc['total_chunks'] or 0
+                token_counts = db.get_chunk_arrays(doc_id, ['token_count'])['token_count']
+                totals['tokens'] += int(token_counts.sum())
+            else:
+                errors.append((queued[doc_id], doc['error_message']))
+    
+    def report():
+        elapsed = time.time() - start
+        print(f"[{elapsed:7.0f}s] {len(finished):,}/{len(queued):,} documents "
+              f"({counts['skipped']:,} skipped) | "
+              f"{format_rate(totals['pages'], elapsed)} pages/s | "
+              f"{format_rate(totals['chunks'], elapsed)} chunks/s | "
+              f"{format_rate(totals['tokens'], elapsed)} tokens/s | "
+              f"queue {processor.get_queue_size():,}", flush=True)
+    
+    try:
+        # Queue as we walk, so workers start on the first files immediately
+        for path in paths:
+            counts['found'] += 1
+            if not os.path.isfile(path):
+                errors.append((path, "File not found"))
+                continue
+            
+            file_hash = db.get_file_hash(path)
+            if file_hash in completed_hashes:
+                counts['skipped'] += 1
+                continue
+            if file_hash in seen_hashes:
+                counts['duplicates'] += 1
+                continue
+            seen_hashes.add(file_hash)
+            
+            try:
+                doc_id = processor.queue_document(path, priority=priority, file_hash=file_hash)
+                queued[doc_id] = path
+            except Exception as e:
+                errors.append((path, str(e)))
+            
+            if time.time() - last_report >= interval:
+                collect_finished()
+                report()
+                last_report = time.time()
+        
+        print(f"📥 Queued {len(queued):,} documents ({counts['skipped']:,} already processed)")
+        while len(finished) < len(queued):
+            time.sleep(min(interval, 1.0))
+            collect_finished()
+            if time.time() - last_report >= interval:
+                report()
+                last_report = time.time()
+    
+    except KeyboardInterrupt:
+        print("\n⏹️  Interrupted; queued documents resume on the next run")
+    
+    finally:
+        processor.stop()
+    
+    collect_finished()
+    elapsed = time.time() - start
+    completed = sum(1 for status in finished.values() if status == 'completed')
+    deleted = sum(1 for status in finished.values() if status == 'deleted')
+    
+    print("\n📊 Summary")
+    print("=" * 40)
+    print(f"Files found:         {counts['found']:,}")
+    print(f"Already processed:   {counts['skipped']:,}")
+    print(f"Duplicate files:     {counts['duplicates']:,}")
+    print(f"Queued:              {len(queued):,}")
+    print(f"Completed:           {completed:,}")
+    print(f"Failed:              {len(errors):,}")
+    print(f"Deleted meanwhile:   {deleted:,}")
+    print(f"Unfinished:          {len(queued) - len(finished):,}")
+    print(f"Pages:               {totals['pages']:,} ({format_rate(totals['pages'], elapsed)}/s)")
+    print(f"Chunks:              {totals['chunks']:,} ({format_rate(totals['chunks'], elapsed)}/s)")
+    print(f"Tokens:              {totals['tokens']:,} ({format_rate(totals['tokens'], elapsed)}/s)")
+    print(f"Elapsed:             {elapsed:,.1f}s")
+    
+    for path, error in errors[:20]:
+        print(f"❌ {path}: {error}")
+    if len(errors) > 20:
+        print(f"   ... and {len(errors) - 20:,} more")
+    
+    return len(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDFs into the document database.")
+    parser.add_argument('directories', nargs='*', help="Directories to search recursively for PDFs")
+    parser.add_argument('--manifest', action='append', default=[],
+                        help="File listing one PDF path per line (repeatable)")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="Ingest (extraction and chunking) worker threads (default: 2)")
+    parser.add_argument('--priority', choices=list(config.JOB_PRIORITIES), default='bulk',
+                        help="Job priority class (default: bulk)")
+    parser.add_argument('--interval', type=float, default=10.0,
+                        help="Seconds between progress lines (default: 10)")
+    parser.add_argument('--verbose', action='store_true', help="Show per-document processing logs")
+    args = parser.parse_args()
+    
+    if not args.directories and not args.manifest:
+        parser.error("give at least one directory or --manifest")
+    
+    if not config.OPENAI_API_KEY:
+        print("❌ OpenAI API key not found in .env file")
+        sys.exit(1)
+    
+    if not args.verbose:
+        for name in ('src', 'httpx'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+    
+    paths = iter_pdf_paths(args.directories, args.manifest)
+    failures = ingest(paths, args.workers, args.priority, args.interval)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,76 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_BATCH_MAX_TOKENS = 100000
+EMBEDDING_MAX_IN_FLIGHT = 4
+EMBEDDING_TOKENS_PER_MINUTE = 1000000
+EMBEDDING_REQUESTS_PER_MINUTE = 3000
+EMBEDDING_MAX_RETRIES = 5
+EMBEDDING_CACHE_MAX_ENTRIES = 100000
+# Cache size is checked (and trimmed) once per this many newly cached embeddings
+EMBEDDING_CACHE_EVICT_INTERVAL = 1000
+EMBEDDING_DTYPE = "float32"
+# Embedding storage: "sqlite" (BLOBs) or "memmap" (per-document sidecar files)
+EMBEDDING_STORAGE = "sqlite"
+EMBEDDING_STORE_DIR = "embeddings"
 CHAT_MODEL = "gpt-4"
 
+# PDF text extraction: pages are split across a process pool for large documents
+PDF_PARALLEL_EXTRACTION = True
+PDF_PARALLEL_MIN_PAGES = 50
+PDF_EXTRACT_WORKERS = None
+EXTRACTED_TEXT_CACHE = True
+
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 
 TOP_K_CHUNKS = 5
 INCLUDE_NEIGHBOR_CHUNKS = True
+NEIGHBOR_WINDOW = 1
+MIN_SIMILARITY = None
+RETRIEVAL_INDEX_CACHE_SIZE = 8
+
+# Vector index backend: "exact" (brute force) or "ivf" (approximate, for large corpora)
+VECTOR_INDEX_BACKEND = "exact"
+VECTOR_INDEX_DIR = "vector_indexes"
+IVF_MIN_VECTORS = 20000
+IVF_LISTS = None
+IVF_NPROBE = 8
+IVF_TRAIN_ITERATIONS = 10
+IVF_TRAIN_SAMPLE_PER_LIST = 64
+# Retrain the corpus IVF index once rows added/removed since training exceed this fraction
+IVF_RETRAIN_DRIFT = 0.5
+# Seconds between checks of the corpus index against documents completed or deleted by other processes
+CORPUS_SYNC_INTERVAL = 5.0
 
 MAX_CONTEXT_TOKENS = 8000
-MAX_RESPONSE_TOKENS = 1500
\ No newline at end of file
+MAX_RESPONSE_TOKENS = 1500
+
+# Document fingerprint for deduplication: "md5" or "blake2b" (faster on 64-bit CPUs)
+FILE_HASH_ALGORITHM = "md5"
+FILE_HASH_BLOCK_SIZE = 1048576
+
+# Ingestion pipeline: ingest (extract + chunk) -> embed -> write stages joined by
+# bounded queues of chunk windows. A window is one embedding request, so the
+# embedding threads bound each process's requests in flight
+PIPELINE_EMBED_WORKERS = 4
+PIPELINE_QUEUE_SIZE = 4
+
+# Durable job queue: workers lease jobs and heartbeat while processing
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_INTERVAL = 1.0
+# Finished (done/failed) jobs are deleted after this long, checked at most once per interval
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+JOB_PRUNE_INTERVAL = 3600
+# Scheduling: jobs run in order of enqueue time + class delay (seconds) +
+# pages x JOB_SECONDS_PER_PAGE, so small and interactive jobs go first but
+# large bulk jobs still age to the front
+JOB_PRIORITIES = {"interactive": 0, "bulk": 600}
+JOB_SECONDS_PER_PAGE = 0.5
+INTERACTIVE_WORKERS = 1
+
+SQLITE_BUSY_TIMEOUT_MS = 30000
+SQLITE_CACHE_SIZE_KB = 65536
+SQLITE_MMAP_SIZE = 268435456
\ No newline at end of file
@@ -20,6 +20,10 @@ decisions about RAG architecture by quantitatively comparing:
 - **embed_and_store**: Text chunking, embedding generation, and similarity search
 - **rag_chain**: Three-method question answering engine with metrics collection
 - **background_processor**: Asynchronous document processing with progress tracking
+- **embedding_dispatcher**: Concurrent, rate-limited embedding requests
+- **retrieval_index**: Cached per-document embedding matrices and corpus-wide search
+- **vector_index**: Exact and approximate (IVF) nearest-neighbor backends
+- **job_queue**: Durable SQLite-backed job queue with leases and heartbeats
 
 ### Key Features
 - Document deduplication using content hashing
@@ -70,6 +74,10 @@ __author__ = "RAG Research Team"
 from .pdf_loader import PDFLoader
 from .database import DocumentDatabase
 from .embed_and_store import DocumentEmbedder
+from .embedding_dispatcher import EmbeddingDispatcher
+from .retrieval_index import RetrievalIndex, IndexCache, CorpusIndex
+from .vector_index import ExactIndex, IVFFlatIndex
+from .job_queue import JobQueue
 from .rag_chain import RAGChain
 from .background_processor import BackgroundProcessor, get_processor, shutdown_processor
 
@@ -77,6 +85,13 @@ __all__ = [
     'PDFLoader',
     'DocumentDatabase', 
     'DocumentEmbedder',
+    'EmbeddingDispatcher',
+    'RetrievalIndex',
+    'IndexCache',
+    'CorpusIndex',
+    'ExactIndex',
+    'IVFFlatIndex',
+    'JobQueue',
     'RAGChain',
     'BackgroundProcessor',
     'get_processor',
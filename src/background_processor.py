@@ -6,44 +6,62 @@ PDF ingestion, chunking, and embedding generation without blocking
 the main application thread.
 
 Key Features:
-- Asynchronous document processing queue
-- Multi-threaded worker pool for parallel processing
+- Durable SQLite-backed job queue (survives restarts, shareable across processes)
+- Staged pipeline: extraction of one document overlaps embedding of another
+- Priority classes (interactive vs bulk) with small-document-first scheduling
+- Shared embedding dispatcher enforcing OpenAI rate limits across workers
 - Progress tracking with callback notifications
 - Automatic error recovery and status updates
 - Database persistence for processed documents
 - Document deduplication to avoid reprocessing
+- Embedding cache reuse for text already embedded in other documents
 
 Architecture:
-- Uses Python's threading and queue modules
-- Worker threads process documents from a shared queue
+- Worker threads lease jobs from a JobQueue table in the document database
+- Leases are heartbeated while a job runs; expired leases are reclaimed,
+  so several ingest processes can drain the same backlog
+- Dedicated interactive workers (config.INTERACTIVE_WORKERS) only take
+  interactive jobs, so uploads never wait behind a bulk document's extraction
+- Stages run in their own threads, joined by bounded queues of chunk
+  windows that apply backpressure (config.PIPELINE_QUEUE_SIZE)
 - Progress callbacks provide real-time status updates
 - SQLite database for persistent storage
 
 Processing Pipeline:
 1. Document queued with metadata
-2. Worker thread picks up job
-3. PDF text extraction
-4. Text chunking with overlap
-5. Embedding generation via OpenAI API
-6. Storage in SQLite database
-7. Status update and callback notification
+2. Ingest stage: a worker thread leases the job, extracts PDF text (large
+   PDFs across the PDFLoader process pool) and chunks pages with overlap
+   as they arrive, submitting windows of chunks
+3. Embedding stage: embedding threads send windows through the shared
+   dispatcher (batched OpenAI API requests)
+4. Writer stage: a single thread checkpoints windows to SQLite, then marks
+   the document completed, builds its index and notifies callbacks
 
 Typical usage:
     processor = get_processor()  # Get singleton instance
     doc_id = processor.queue_document(file_path, filename, callback)
     status = processor.get_document_status(doc_id)
     embeddings_df = processor.get_embeddings_df(doc_id)
+    retrieval_index = processor.get_retrieval_index(doc_id)
+    corpus_index = processor.get_corpus_index()
 """
 
 import threading
 import queue
+import itertools
+import math
 import time
-from typing import Dict, Callable, Optional
+from contextlib import ExitStack
+from typing import List, Dict, Callable, Iterator, Optional, Tuple
 import logging
 from datetime import datetime
-from .pdf_loader import PDFLoader
+from .pdf_loader import PDFLoader, EXTRACTOR_VERSION
 from .embed_and_store import DocumentEmbedder
 from .database import DocumentDatabase
+from .job_queue import JobQueue
+from .embedding_dispatcher import EmbeddingDispatcher
+from .retrieval_index import RetrievalIndex, IndexCache, CorpusIndex
+from .vector_index import load_or_build
 from openai import OpenAI
 import config
 import os
@@ -52,6 +70,67 @@ import os
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class _DocumentRun:
+    """
+    Pipeline state of one document, from job claim until it is finished.
+    
+    The ingest stage sets up the run and numbers the windows it submits;
+    the writer stage writes them back in that order and finishes the run
+    once the ingest stage's end marker and every window have arrived.
+    """
+    def __init__(self, job: Dict):
+        self.job = job
+        self.doc_id = job['document_id']
+        self.sort_key = job.get('_sort_key', 0)
+        self.lease = ExitStack()  # keeps the job's lease alive until finished
+        self.num_pages = 0
+        self.pages_read = 0
+        self.n_chunks = 0
+        self.n_stored = 0
+        self.windows_submitted = 0
+        self.windows_written = 0
+        self.pending_windows: Dict[int, List[Dict]] = {}  # embedded ahead of an earlier window
+        self.sealed = False
+        self.error: Optional[str] = None
+        self.retryable = False  # error is transient (embedding); retry the job
+        self.cancelled = False  # document deleted; drop remaining work
+        self.stopped = False  # processor stopped; job released, drop remaining work
+
+def _iter_windows(chunks: Iterator[Dict], max_chunks: int = None,
+                  max_tokens: int = None) -> Iterator[List[Dict]]:
+    """
+    Group a chunk stream into windows of at most one embedding request.
+    
+    A window closes as soon as it reaches max_chunks chunks or max_tokens
+    tokens, so embedding of a document starts after its first batch
+    rather than after several.
+    
+    Args:
+        chunks: Chunks from chunk_pages()
+        max_chunks: Chunks per window (default: config.EMBEDDING_BATCH_SIZE)
+        max_tokens: Tokens per window (default: config.EMBEDDING_BATCH_MAX_TOKENS)
+    
+    Yields:
+        Lists of consecutive chunks
+    """
+    max_chunks = max_chunks or config.EMBEDDING_BATCH_SIZE
+    max_tokens = max_tokens or config.EMBEDDING_BATCH_MAX_TOKENS
+    
+    window, tokens = [], 0
+    for chunk in chunks:
+        if window and tokens + chunk['token_count'] > max_tokens:
+            yield window
+            window, tokens = [], 0
+        
+        window.append(chunk)
+        tokens += chunk['token_count']
+        if len(window) >= max_chunks:
+            yield window
+            window, tokens = [], 0
+    
+    if window:
+        yield window
+
 class BackgroundProcessor:
     """
     Manages asynchronous document processing with worker threads.
@@ -64,222 +143,643 @@ class BackgroundProcessor:
         Initialize the background processor.
         
         Args:
-            max_workers: Number of worker threads (default: 1)
+            max_workers: Number of ingest (extraction and chunking) threads (default: 1)
         
         Note:
-            Single worker recommended to avoid OpenAI rate limits
+            All workers share one EmbeddingDispatcher, so request and token
+            budgets hold regardless of the number of workers
         """
         self.db = DocumentDatabase()
         self.pdf_loader = PDFLoader()
         self.client = OpenAI(api_key=config.OPENAI_API_KEY) if config.OPENAI_API_KEY else None
         self.embedder = DocumentEmbedder(self.client) if self.client else None
+        self.dispatcher = EmbeddingDispatcher(self.embedder) if self.embedder else None
+        self.index_cache = IndexCache()
+        self.vector_index_dir = os.path.join(os.path.dirname(os.path.abspath(self.db.db_path)),
+                                             config.VECTOR_INDEX_DIR)
+        self.corpus_index: Optional[CorpusIndex] = None
+        self.corpus_lock = threading.Lock()
+        self.corpus_synced_at = 0.0
         
         self.max_workers = max_workers
-        self.job_queue = queue.Queue()
+        self.job_queue = JobQueue(self.db)
         self.workers = []
         self.running = False
         
+        # Pipeline stages hand work on through bounded queues, so a stage that
+        # falls behind blocks the one feeding it instead of buffering
+        self.embed_workers = config.PIPELINE_EMBED_WORKERS
+        # Windows are embedded in job schedule order, so interactive documents overtake bulk ones
+        self.embed_queue = queue.PriorityQueue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        self.embed_sequence = itertools.count()
+        self.write_queue = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+        # Completed documents whose retrieval index is built once the writer has moved on
+        self.index_queue = queue.Queue()
+        self.stage_threads = []
+        self.runs: Dict[int, _DocumentRun] = {}
+        # Held by the writer per item and by delete_document, so a document
+        # is never written after (or while) it is deleted
+        self.write_lock = threading.Lock()
+        
         # Progress callbacks
-        self.progress_callbacks: Dict[int, Callable] = {}
+        self.progress_callbacks: Dict[int, List[Callable]] = {}
         
-        # Start workers
+        # Start workers and pick up work interrupted by a previous shutdown
         self.start()
+        self.requeue_unfinished()
     
     def start(self):
         """
-        Start worker threads for processing.
+        Start the pipeline threads.
         
-        Spawns daemon threads that process jobs from the queue.
+        Spawns max_workers ingest threads that claim jobs from the queue,
+        config.INTERACTIVE_WORKERS ingest threads reserved for interactive
+        jobs, config.PIPELINE_EMBED_WORKERS embedding threads, one writer
+        thread and one indexing thread.
         Safe to call multiple times (no-op if already running).
         """
         if self.running:
             return
-            
+        
         self.running = True
-        for i in range(self.max_workers):
-            worker = threading.Thread(target=self._worker_loop, name=f"Worker-{i}")
+        ingest = [(f"Worker-{i}", None) for i in range(self.max_workers)]
+        ingest += [(f"Interactive-{i}", ['interactive']) for i in range(config.INTERACTIVE_WORKERS)]
+        for name, priorities in ingest:
+            worker = threading.Thread(target=self._worker_loop, args=(priorities,), name=name)
             worker.daemon = True
             worker.start()
             self.workers.append(worker)
         
-        logger.info(f"Started {self.max_workers} background workers")
+        stages = [(f"Embedder-{i}", self._embed_loop) for i in range(self.embed_workers)]
+        stages.append(("Writer", self._write_loop))
+        stages.append(("Indexer", self._index_loop))
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.stage_threads.append(thread)
+        
+        logger.info(f"Started {self.max_workers} background workers "
+                    f"(+{config.INTERACTIVE_WORKERS} interactive), "
+                    f"{self.embed_workers} embedding workers, a writer and an indexer")
     
     def stop(self):
         """
-        Stop all worker threads gracefully.
+        Stop all pipeline threads gracefully.
         
-        Sends sentinel values to stop workers and waits for completion.
-        Times out after 5 seconds per worker if they don't respond.
+        Documents still in the pipeline are abandoned first: their jobs go
+        back to the queue without using up an attempt, so the next start
+        (or another process) resumes them from their checkpointed chunks.
+        Idle workers notice within config.JOB_POLL_INTERVAL, then the
+        embedding, writer and indexing stages drain whatever is queued.
+        Times out after 5 seconds per thread if they don't respond.
         """
         self.running = False
+        with self.job_queue.wakeup:
+            self.job_queue.wakeup.notify_all()
         
-        # Add sentinel values to stop workers
-        for _ in range(self.max_workers):
-            self.job_queue.put(None)
-        
-        # Wait for workers to finish
+        # Abandon in-flight documents (again once the workers are gone, in
+        # case one claimed a job meanwhile), then stop each stage behind its backlog
+        self._abort_runs()
         for worker in self.workers:
             worker.join(timeout=5)
+        self._abort_runs()
+        
+        embedders = self.stage_threads[:self.embed_workers]
+        writers, indexers = self.stage_threads[-2:-1], self.stage_threads[-1:]
+        sentinels = ((self.embed_queue, embedders, (math.inf, next(self.embed_sequence), None, None, None)),
+                     (self.write_queue, writers, None),
+                     (self.index_queue, indexers, None))
+        for stage_queue, threads, sentinel in sentinels:
+            try:
+                for _ in threads:
+                    stage_queue.put(sentinel, timeout=5)
+            except queue.Full:
+                pass
+            for thread in threads:
+                thread.join(timeout=5)
+        
+        if self.dispatcher:
+            self.dispatcher.shutdown()
+        self.pdf_loader.close()
+        if self.corpus_index is not None:
+            self.corpus_index.save()
         
         logger.info("Stopped background workers")
     
-    def _worker_loop(self):
+    def _abort_runs(self):
+        """
+        Release the jobs of all documents still in the pipeline.
+        
+        Each run's lease stops being renewed and nothing more is embedded
+        or written for it; its document goes back to 'pending'.
+        """
+        with self.write_lock:
+            for doc_id, run in list(self.runs.items()):
+                run.stopped = True
+                self.runs.pop(doc_id, None)
+                run.lease.close()
+                try:
+                    self.db.update_document_status(doc_id, 'pending')
+                    self.job_queue.release(run.job, "Interrupted by shutdown", count_attempt=False)
+                    logger.info(f"Released document {doc_id} ({run.n_stored} chunks kept)")
+                except Exception as e:
+                    logger.error(f"Could not release job for document {doc_id}: {e}")
+    
+    def requeue_unfinished(self) -> int:
+        """
+        Queue documents left 'pending' or 'processing' without a live job.
+        
+        Called on startup. Jobs leased by exited local processes are
+        released for reclaiming; documents with no queued or leased job at
+        all (e.g. from before the durable queue) get a new one. Either way
+        processing resumes from the first un-embedded chunk, since embedded
+        chunks are checkpointed as they complete.
+        
+        Returns:
+            int: Number of documents requeued
         """
-        Main worker thread loop.
+        if not self.client:
+            return 0
         
-        Continuously processes jobs from the queue until stopped.
-        Handles exceptions gracefully to prevent thread death.
+        self.job_queue.release_orphans()
+        active = set(self.job_queue.active_document_ids())
+        unfinished = [doc for doc in self.db.get_documents('pending') + self.db.get_documents('processing')
+                      if doc['id'] not in active]
+        for doc in sorted(unfinished, key=lambda doc: doc['id']):
+            self.job_queue.put({
+                'document_id': doc['id'],
+                'file_path': doc['original_path'],
+                'filename': doc['filename'],
+                'file_hash': doc['file_hash']
+            }, priority='bulk', size=doc['num_pages'])
+        
+        if unfinished:
+            logger.info(f"Requeued {len(unfinished)} unfinished documents")
+        return len(unfinished)
+    
+    def _worker_loop(self, priorities: List[str] = None):
         """
+        Ingest stage thread loop.
+        
+        Claims jobs from the durable queue until stopped and feeds each
+        document into the pipeline. Jobs that have already been claimed
+        config.JOB_MAX_ATTEMPTS times (their workers kept dying) are failed
+        instead of processed. Handles exceptions gracefully to prevent
+        thread death.
+        
+        Args:
+            priorities: Only claim jobs of these priority classes (default: any)
+        """
+        # Without a client jobs would only fail; leave them for a process that has one
+        if not self.client:
+            return
+        
+        worker_id = JobQueue.worker_id(threading.current_thread().name)
         while self.running:
             try:
-                job = self.job_queue.get(timeout=1)
-                if job is None:  # Sentinel to stop worker
+                job = self.job_queue.claim(worker_id, timeout=config.JOB_POLL_INTERVAL,
+                                           priorities=priorities)
+                if job is None:
+                    continue
+                if not self.running:
+                    self.job_queue.release(job, count_attempt=False)
                     break
                 
-                self._process_job(job)
-                self.job_queue.task_done()
+                if job['_attempts'] > self.job_queue.max_attempts:
+                    error_msg = f"Abandoned after {job['_attempts'] - 1} interrupted attempts"
+                    self.db.update_document_status(job['document_id'], 'failed', error_msg)
+                    self._notify_progress(job['document_id'], 'failed', 0, f"Processing failed: {error_msg}")
+                    self.job_queue.fail(job, error_msg)
+                    continue
                 
-            except queue.Empty:
-                continue
+                # Deleted, or completed by a job this one raced with
+                doc = self.db.get_document_by_id(job['document_id'])
+                if not doc or doc['status'] == 'completed':
+                    if doc:
+                        self._notify_progress(doc['id'], 'completed', 100, "Document already processed")
+                    self.job_queue.complete(job)
+                    continue
+                
+                self._process_job(job)
+            
             except Exception as e:
                 logger.error(f"Worker error: {e}")
     
     def _process_job(self, job: Dict):
         """
-        Process a single document job.
+        Run the ingest stage for a single document job.
         
-        Executes the complete pipeline:
-        1. Load PDF and extract text
-        2. Chunk text into overlapping segments
-        3. Generate embeddings for each chunk
-        4. Store in database
-        5. Update status and notify callbacks
+        Extracts PDF text page by page (or reads it from the extracted-text
+        cache), chunks pages into overlapping segments as they arrive and
+        submits each window of chunks to the embedding stage. Returns once
+        the whole document has been submitted, so the worker can start
+        extracting the next document while this one is still embedding;
+        the writer stage checkpoints the windows and finishes the job.
+        
+        Chunks already checkpointed by an interrupted run (with the same
+        chunking parameters) are skipped, so processing resumes from the
+        first un-embedded chunk.
         
         Args:
             job: Dictionary containing:
                 - document_id: Database document ID
                 - file_path: Path to PDF file
                 - filename: Original filename
+                - file_hash: Content fingerprint computed at queue time
         """
         doc_id = job['document_id']
         file_path = job['file_path']
         
         logger.info(f"Processing document {doc_id}: {file_path}")
         
+        run = _DocumentRun(job)
+        run.lease.enter_context(self.job_queue.keep_alive(job))
+        self.runs[doc_id] = run
+        
         try:
             # Update status to processing
             self.db.update_document_status(doc_id, 'processing')
             self._notify_progress(doc_id, 'processing', 0, "Starting document processing...")
             
-            # Load PDF
-            self._notify_progress(doc_id, 'processing', 10, "Loading PDF...")
-            with open(file_path, 'rb') as f:
-                document_text = self.pdf_loader.load_pdf(f)
+            # Extract and chunk as a stream: each window (one embedding
+            # request's worth of chunks) is handed to the embedding stage as
+            # soon as it fills
+            self._notify_progress(doc_id, 'processing', 10, "Extracting and chunking text...")
+            doc = self.db.get_document_by_id(doc_id)
+            run.num_pages = (doc or {}).get('num_pages') or 0
+            
+            # Checkpointed chunks are only reusable if cut the same way and
+            # embedded by the same model
+            chunk_params = (f"{self.embedder.chunk_size}/{self.embedder.overlap}/"
+                            f"{EXTRACTOR_VERSION}/{config.EMBEDDING_MODEL}")
+            if (doc or {}).get('chunk_params') != chunk_params:
+                self.db.delete_chunks(doc_id)
+                self.db.set_chunk_params(doc_id, chunk_params)
             
-            if not document_text:
+            done = set(self.db.get_embedded_chunk_ids(doc_id).tolist())
+            run.n_stored = len(done)
+            if done:
+                logger.info(f"Resuming document {doc_id}: {len(done)} chunks already embedded")
+            
+            def track_pages(pages):
+                for page_number, page_text in pages:
+                    run.pages_read = page_number
+                    yield page_number, page_text
+            
+            file_hash = job.get('file_hash') or (doc or {}).get('file_hash')
+            chunk_stream = self.embedder.chunk_pages(track_pages(self._iter_pages(file_path, file_hash)))
+            for window in _iter_windows(chunk_stream):
+                if run.cancelled or run.stopped:
+                    break
+                run.n_chunks += len(window)
+                todo = [chunk for chunk in window if chunk['chunk_id'] not in done]
+                if todo:
+                    # Blocks while the embedding stage is config.PIPELINE_QUEUE_SIZE windows behind
+                    window_number = run.windows_submitted
+                    run.windows_submitted += 1
+                    self.embed_queue.put((run.sort_key, next(self.embed_sequence), run, window_number, todo))
+            
+            if not run.n_chunks:
                 raise Exception("Failed to extract text from PDF")
+            logger.info(f"Created {run.n_chunks} chunks for document {doc_id}")
+        
+        except Exception as e:
+            run.error = str(e)
+        
+        # End-of-document marker: the writer finishes the run once it has
+        # also written every window submitted above
+        self.write_queue.put((run, None, None))
+    
+    def _embed_loop(self):
+        """
+        Embedding stage thread loop.
+        
+        Embeds windows submitted by the ingest stage and passes them on to
+        the writer. The embedding threads share one dispatcher, so windows
+        from one or several documents are in flight together, up to
+        config.EMBEDDING_MAX_IN_FLIGHT requests.
+        """
+        while True:
+            _, _, run, window_number, chunks = self.embed_queue.get()
+            if run is None:
+                break
             
-            # Chunk text
-            self._notify_progress(doc_id, 'processing', 30, "Chunking text...")
-            chunks = self.embedder.chunk_text(document_text)
-            logger.info(f"Created {len(chunks)} chunks for document {doc_id}")
+            embedded = []
+            try:
+                if not run.error and not run.cancelled and not run.stopped:
+                    embedded = self._embed_chunks(run.doc_id, chunks)
+                    if len(embedded) < len(chunks):
+                        # The embedded part is still checkpointed; a retry
+                        # resumes from the missing chunks
+                        run.error = run.error or f"{len(chunks) - len(embedded)} chunks failed to embed"
+                        run.retryable = True
+            except Exception as e:
+                logger.error(f"Embedding error for document {run.doc_id}: {e}")
+                run.error = run.error or str(e)
+                run.retryable = True
             
-            # Generate embeddings
-            self._notify_progress(doc_id, 'processing', 40, f"Generating embeddings for {len(chunks)} chunks...")
-            embeddings_data = []
+            # Every submitted window reaches the writer, embedded or not
+            self.write_queue.put((run, window_number, embedded))
+    
+    def _write_loop(self):
+        """
+        Writer stage thread loop.
+        
+        Checkpoints embedded windows to the database in chunk order and
+        finishes each document once its end marker and all of its windows
+        have been seen. Windows that finish embedding ahead of an earlier
+        one of the same document wait for it, so the document's sidecar
+        rows stay contiguous and can be memory-mapped without a copy. A
+        single writer keeps SQLite write transactions from contending with
+        each other. Windows of documents deleted meanwhile (here or by
+        another process) are discarded.
+        """
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
             
-            for i, chunk in enumerate(chunks):
-                try:
-                    response = self.client.embeddings.create(
-                        model=config.EMBEDDING_MODEL,
-                        input=chunk['text']
-                    )
-                    
-                    embedding = response.data[0].embedding
-                    chunk['embedding'] = embedding
-                    embeddings_data.append(chunk)
-                    
-                    # Update progress
-                    progress = 40 + int((i + 1) / len(chunks) * 50)
-                    self._notify_progress(doc_id, 'processing', progress, 
-                                        f"Generated embedding {i+1}/{len(chunks)}")
-                    
-                except Exception as e:
-                    logger.error(f"Error generating embedding for chunk {i}: {e}")
-                    # Continue with other chunks
+            run, window_number, embedded = item
+            with self.write_lock:
+                if run.stopped:
+                    # Released by stop(); the next attempt writes it
                     continue
-            
-            if not embeddings_data:
+                if window_number is None:
+                    run.sealed = True
+                else:
+                    run.pending_windows[window_number] = embedded
+                    while run.windows_written in run.pending_windows:
+                        embedded = run.pending_windows.pop(run.windows_written)
+                        run.windows_written += 1
+                        self._write_window(run, embedded)
+                
+                if run.sealed and run.windows_written == run.windows_submitted:
+                    self._finish_run(run)
+    
+    def _write_window(self, run: '_DocumentRun', embedded: List[Dict]):
+        """
+        Checkpoint one embedded window of a document.
+        
+        Args:
+            run: Pipeline state of the document
+            embedded: Chunks with embeddings (empty if the window failed)
+        """
+        try:
+            if embedded and not run.cancelled and not self.db.get_document_by_id(run.doc_id):
+                run.cancelled = True
+            if embedded and not run.cancelled:
+                # Checkpoint: a crash from here on loses only windows still queued
+                self.db.add_chunks(run.doc_id, embedded, total_chunks=run.n_stored + len(embedded))
+                run.n_stored += len(embedded)
+                
+                progress = 10 + int(80 * run.pages_read / run.num_pages) if run.num_pages else 50
+                self._notify_progress(run.doc_id, 'processing', min(progress, 89),
+                                    f"Embedded {run.n_stored} chunks "
+                                    f"({run.pages_read}/{run.num_pages} pages)")
+        except Exception as e:
+            logger.error(f"Writer error for document {run.doc_id}: {e}")
+            run.error = run.error or str(e)
+    
+    def _finish_run(self, run: '_DocumentRun'):
+        """
+        Mark a fully written document completed (or failed) and finish its job.
+        
+        Runs that failed to embed some chunks are released back to the queue
+        instead, while the job has attempts left; the next attempt resumes
+        from the chunks that are not checkpointed yet. Runs of deleted
+        documents only finish their job. Runs on the writer thread, so
+        building the retrieval index is left to the indexing stage.
+        
+        Args:
+            run: Pipeline state of the document
+        """
+        doc_id = run.doc_id
+        retry = False
+        try:
+            if run.cancelled or not self.db.get_document_by_id(doc_id):
+                logger.info(f"Document {doc_id} was deleted during processing; discarded")
+                return
+            if run.error:
+                raise Exception(run.error)
+            if not run.n_stored:
                 raise Exception("Failed to generate any embeddings")
             
-            # Store in database
-            self._notify_progress(doc_id, 'processing', 90, "Saving to database...")
-            self.db.add_chunks(doc_id, embeddings_data)
-            
-            # Mark as completed
+            # Mark as completed; the indexer builds its retrieval index while it's warm
             self.db.update_document_status(doc_id, 'completed')
+            self.index_queue.put(doc_id)
             self._notify_progress(doc_id, 'completed', 100, 
-                                f"Processing complete! Generated {len(embeddings_data)} embeddings.")
+                                f"Processing complete! Generated {run.n_stored} embeddings.")
             
             logger.info(f"Successfully processed document {doc_id}")
-            
+        
         except Exception as e:
             error_msg = str(e)
-            logger.error(f"Error processing document {doc_id}: {error_msg}")
-            self.db.update_document_status(doc_id, 'failed', error_msg)
-            self._notify_progress(doc_id, 'failed', 0, f"Processing failed: {error_msg}")
+            retry = run.retryable and run.job.get('_attempts', 1) < self.job_queue.max_attempts
+            if retry:
+                logger.warning(f"Retrying document {doc_id} ({run.n_stored} chunks kept): {error_msg}")
+                self.db.update_document_status(doc_id, 'pending', error_msg)
+                self._notify_progress(doc_id, 'pending', 0, f"Retrying after error: {error_msg}")
+            else:
+                logger.error(f"Error processing document {doc_id}: {error_msg}")
+                self.db.update_document_status(doc_id, 'failed', error_msg)
+                self._notify_progress(doc_id, 'failed', 0, f"Processing failed: {error_msg}")
+        
+        finally:
+            self.runs.pop(doc_id, None)
+            run.lease.close()
+            try:
+                if retry:
+                    self.job_queue.release(run.job, run.error)
+                else:
+                    self.job_queue.complete(run.job, run.error)
+            except Exception as e:
+                logger.error(f"Could not finish job for document {doc_id}: {e}")
+    
+    def _index_loop(self):
+        """
+        Indexing stage thread loop.
+        
+        Builds the retrieval index of each document the writer completes
+        (including any approximate vector index) and adds it to the corpus
+        index, off the writer thread so writes and deletes never wait on
+        index training. The corpus is only updated under the write lock,
+        after checking that the document was not deleted meanwhile.
+        """
+        while True:
+            doc_id = self.index_queue.get()
+            if doc_id is None:
+                break
+            
+            try:
+                index = self.get_retrieval_index(doc_id)
+                with self.write_lock:
+                    doc = self.db.get_document_by_id(doc_id)
+                    if doc is None:
+                        # Deleted while indexing: drop what was just built
+                        self.index_cache.invalidate(doc_id)
+                        if os.path.exists(self._vector_index_path(doc_id)):
+                            os.remove(self._vector_index_path(doc_id))
+                    elif self.corpus_index is not None and doc['revision'] == index.version:
+                        self.corpus_index.add_document(doc_id, index, doc)
+            except Exception as e:
+                logger.error(f"Indexing error for document {doc_id}: {e}")
+    
+    def _iter_pages(self, file_path: str, file_hash: str = None) -> Iterator[Tuple[int, str]]:
+        """
+        Yield a document's pages, from the extracted-text cache when possible.
+        
+        On a cache miss the PDF is extracted and each page is written to the
+        cache as it streams past, so retries and re-chunking of the same file
+        skip extraction entirely.
+        
+        Args:
+            file_path: Path to the PDF file
+            file_hash: File fingerprint (cache key; None disables the cache)
+        
+        Yields:
+            Tuple of (page_number, page_text)
+        """
+        use_cache = bool(file_hash) and config.EXTRACTED_TEXT_CACHE
+        if use_cache and self.db.has_extracted_text(file_hash, EXTRACTOR_VERSION):
+            logger.info(f"Using cached extracted text for {file_path}")
+            yield from self.db.iter_extracted_pages(file_hash, EXTRACTOR_VERSION)
+            return
+        
+        batch = []
+        num_pages = 0
+        with open(file_path, 'rb') as f:
+            for page_number, page_text in self.pdf_loader.iter_pages(f):
+                yield page_number, page_text
+                num_pages += 1
+                if use_cache:
+                    batch.append((page_number, page_text))
+                    if len(batch) >= 100:
+                        self.db.add_extracted_pages(file_hash, EXTRACTOR_VERSION, batch)
+                        batch = []
+        
+        if use_cache:
+            self.db.add_extracted_pages(file_hash, EXTRACTOR_VERSION, batch, num_pages)
+    
+    def _embed_chunks(self, doc_id: int, chunks: List[Dict],
+                      progress_callback: Callable = None) -> List[Dict]:
+        """
+        Embed chunks, reusing cached embeddings where possible.
+        
+        Chunks whose normalized text is already in the embedding cache are
+        filled from it; the rest are sent through the shared dispatcher
+        (one request per distinct text) and added to the cache.
+        
+        Args:
+            doc_id: Document ID (for logging)
+            chunks: Chunks from chunk_text() / chunk_pages()
+            progress_callback: Optional function called with (processed, total)
+                as dispatched batches complete
+        
+        Returns:
+            List of chunks with embeddings, in document order
+        """
+        model = config.EMBEDDING_MODEL
+        by_hash: Dict[str, List[Dict]] = {}
+        for chunk in chunks:
+            by_hash.setdefault(self.db.get_text_hash(chunk['text']), []).append(chunk)
+        
+        cached = self.db.get_cached_embeddings(model, list(by_hash))
+        embeddings_data = []
+        pending = {}
+        
+        for text_hash, same_text in by_hash.items():
+            if text_hash in cached:
+                for chunk in same_text:
+                    chunk['embedding'] = cached[text_hash].tolist()
+                embeddings_data.extend(same_text)
+            else:
+                pending[same_text[0]['chunk_id']] = text_hash
+        
+        logger.debug(f"Embedding cache: {len(cached)} hits, {len(pending)} misses for document {doc_id}")
+        
+        to_embed = [by_hash[text_hash][0] for text_hash in pending.values()]
+        embedded, _ = self.dispatcher.embed_chunks(to_embed, progress_callback)
+        new_embeddings = {}
+        
+        for chunk in embedded:
+            text_hash = pending[chunk['chunk_id']]
+            new_embeddings[text_hash] = chunk['embedding']
+            for duplicate in by_hash[text_hash]:
+                duplicate['embedding'] = chunk['embedding']
+            embeddings_data.extend(by_hash[text_hash])
+        
+        self.db.cache_embeddings(model, new_embeddings)
+        
+        embeddings_data.sort(key=lambda chunk: chunk['chunk_id'])
+        return embeddings_data
     
     def _notify_progress(self, doc_id: int, status: str, progress: int, message: str):
         """
-        Send progress update to registered callback.
+        Send progress update to every callback registered for the document.
         
         Args:
             doc_id: Document ID
-            status: Current status ('processing', 'completed', 'failed')
+            status: Current status ('pending' when retrying, 'processing', 'completed', 'failed')
             progress: Progress percentage (0-100)
             message: Status message
         """
-        if doc_id in self.progress_callbacks:
+        for callback in list(self.progress_callbacks.get(doc_id, ())):
             try:
-                self.progress_callbacks[doc_id](doc_id, status, progress, message)
+                callback(doc_id, status, progress, message)
             except Exception as e:
                 logger.error(f"Progress callback error: {e}")
     
     def queue_document(self, file_path: str, filename: str = None, 
-                      progress_callback: Callable = None) -> int:
+                      progress_callback: Callable = None,
+                      priority: str = 'interactive', file_hash: str = None) -> int:
         """
         Queue a document for background processing.
         
         Adds document to database and processing queue. If document
-        was already processed (same hash), returns immediately.
+        was already processed (same hash), returns immediately. If it is
+        already queued or processing (e.g. the same file uploaded twice at
+        once), the callback is attached to the existing job instead of
+        queueing another.
         
         Args:
             file_path: Path to PDF file
             filename: Display name (defaults to basename)
             progress_callback: Function called with (doc_id, status, progress, message)
+            priority: Scheduling class, 'interactive' (user uploads) or 'bulk'
+                (backfills and re-ingests); see config.JOB_PRIORITIES
+            file_hash: Fingerprint from DocumentDatabase.get_file_hash(), if
+                the caller already computed it (saves re-reading the file)
         
         Returns:
             int: Document ID for tracking
         
         Raises:
             Exception: If OpenAI client not configured or file not found
+            ValueError: If priority is not a known class
         """
         if not self.client:
             raise Exception("OpenAI client not configured")
         
+        if priority not in config.JOB_PRIORITIES:
+            raise ValueError(f"Unknown job priority: {priority}")
+        
         if not os.path.exists(file_path):
             raise Exception(f"File not found: {file_path}")
         
         filename = filename or os.path.basename(file_path)
         file_size = os.path.getsize(file_path)
         
+        # Fingerprint once; the hash travels with the job from here on
+        file_hash = file_hash or self.db.get_file_hash(file_path)
+        
         # Get document info
         with open(file_path, 'rb') as f:
             doc_info = self.pdf_loader.get_document_info(f)
             num_pages = doc_info.get('num_pages', 0)
         
         # Add to database
-        doc_id = self.db.add_document(filename, file_path, file_size, num_pages)
+        doc_id = self.db.add_document(filename, file_path, file_size, num_pages, file_hash)
         
         # Check if already processed
         doc = self.db.get_document_by_id(doc_id)
@@ -289,19 +789,26 @@ class BackgroundProcessor:
                 progress_callback(doc_id, 'completed', 100, "Document already processed")
             return doc_id
         
-        # Register progress callback
+        # A retry of a failed document starts over as pending, so status
+        # readers don't see the previous attempt's failure as this job's
+        if doc and doc['status'] == 'failed':
+            self.db.update_document_status(doc_id, 'pending')
+        
+        # Register progress callback alongside any from concurrent requests
         if progress_callback:
-            self.progress_callbacks[doc_id] = progress_callback
+            self.progress_callbacks.setdefault(doc_id, []).append(progress_callback)
         
         # Queue for processing
         job = {
             'document_id': doc_id,
             'file_path': file_path,
-            'filename': filename
+            'filename': filename,
+            'file_hash': file_hash
         }
         
-        self.job_queue.put(job)
-        logger.info(f"Queued document {doc_id} for processing")
+        # Coalesces into the document's existing job, if it has one
+        job_id = self.job_queue.put(job, priority=priority, size=num_pages)
+        logger.info(f"Queued document {doc_id} for processing as job {job_id} ({priority})")
         
         return doc_id
     
@@ -317,26 +824,153 @@ class BackgroundProcessor:
         """
         return self.db.get_document_by_id(doc_id)
     
-    def get_embeddings_df(self, doc_id: int):
+    def get_embeddings_df(self, doc_id: int, columns: List[str] = None):
         """
         Retrieve processed embeddings for a document.
         
         Args:
             doc_id: Document ID
+            columns: Columns to load (default: all); e.g. ['token_count']
+                for statistics without loading text or embeddings
         
         Returns:
             pd.DataFrame with chunks and embeddings
         """
-        return self.db.get_chunks_df(doc_id)
+        return self.db.get_chunks_df(doc_id, columns)
+    
+    def get_chunk_texts(self, doc_id: int, chunk_ids: List[int]) -> Dict[int, str]:
+        """
+        Fetch the text of selected chunks of a document.
+        
+        Args:
+            doc_id: Document ID
+            chunk_ids: Chunk identifiers
+        
+        Returns:
+            Dict mapping chunk_id to text
+        """
+        return self.db.get_chunk_texts(doc_id, chunk_ids)
+    
+    def get_retrieval_index(self, doc_id: int) -> RetrievalIndex:
+        """
+        Get the query-ready retrieval index for a document.
+        
+        Indexes are cached (LRU) and keyed by the document's revision,
+        which changes each time it completes, so a reprocessed document is
+        rebuilt on next access.
+        
+        Args:
+            doc_id: Document ID
+        
+        Returns:
+            RetrievalIndex (empty if the document has no embeddings)
+        """
+        doc = self.db.get_document_by_id(doc_id)
+        version = doc['revision'] if doc else None
+        
+        # Share the corpus segment when the corpus is loaded and current
+        if self.corpus_index is not None:
+            segment = self.corpus_index.get_segment(doc_id)
+            if segment is not None and segment.version == version:
+                return segment
+        
+        return self.index_cache.get_or_build(doc_id, version,
+                                             lambda: self._build_retrieval_index(doc_id, version))
+    
+    def _build_retrieval_index(self, doc_id: int, version) -> RetrievalIndex:
+        """
+        Load a document's chunks and build its retrieval index.
+        
+        Chunk text is not loaded; the index fetches it from the database
+        for the chunks a query selects. Large documents get the configured
+        approximate vector index, persisted under config.VECTOR_INDEX_DIR
+        next to the database.
+        
+        Args:
+            doc_id: Document ID
+            version: Document version tag (revision)
+        
+        Returns:
+            RetrievalIndex for the document
+        """
+        arrays = self.db.get_chunk_arrays(doc_id, ['token_count', 'embedding'])
+        index = RetrievalIndex.from_arrays(arrays, version,
+                                           lambda chunk_ids: self.db.get_chunk_texts(doc_id, chunk_ids))
+        index.vector_index = load_or_build(index.matrix, self._vector_index_path(doc_id), version)
+        return index
+    
+    def _vector_index_path(self, doc_id: int = None) -> str:
+        name = f"doc_{doc_id}.npz" if doc_id is not None else "corpus.npz"
+        return os.path.join(self.vector_index_dir, name)
+    
+    def get_corpus_index(self) -> CorpusIndex:
+        """
+        Get the corpus-level index over all completed documents.
+        
+        The corpus is loaded from the database on first use and then kept
+        current incrementally as documents complete or are deleted here.
+        At most every config.CORPUS_SYNC_INTERVAL seconds it is also
+        checked against the database's completed documents (IDs and
+        revisions), which picks up documents completed, reprocessed or
+        deleted by other processes such as bulk_ingest.
+        
+        Returns:
+            CorpusIndex shared by all callers
+        """
+        with self.corpus_lock:
+            if self.corpus_index is None:
+                self.corpus_index = CorpusIndex(self._vector_index_path())
+                self._sync_corpus_index()
+                logger.info(f"Loaded corpus index: {len(self.corpus_index.documents)} documents, "
+                            f"{len(self.corpus_index)} chunks")
+            elif time.monotonic() - self.corpus_synced_at >= config.CORPUS_SYNC_INTERVAL:
+                added, removed = self._sync_corpus_index()
+                if added or removed:
+                    logger.info(f"Synced corpus index: {added} documents added or updated, {removed} removed")
+            
+            return self.corpus_index
+    
+    def _sync_corpus_index(self) -> Tuple[int, int]:
+        """
+        Add and drop corpus segments to match the database's completed documents.
+        
+        Returns:
+            Tuple of (documents added or updated, documents removed)
+        
+        Note:
+            Called with corpus_lock held
+        """
+        corpus = self.corpus_index
+        revisions = self.db.get_document_revisions('completed')
+        
+        removed = [doc_id for doc_id in list(corpus.documents) if doc_id not in revisions]
+        for doc_id in removed:
+            corpus.remove_document(doc_id)
+            self.index_cache.invalidate(doc_id)
+        
+        stale = [doc_id for doc_id, revision in revisions.items()
+                 if getattr(corpus.get_segment(doc_id), 'version', None) != revision]
+        added = 0
+        for doc in self.db.get_documents_by_ids(stale).values():
+            if doc['status'] != 'completed':
+                continue
+            index = self.index_cache.get(doc['id'], doc['revision'])
+            if index is None:
+                index = self._build_retrieval_index(doc['id'], doc['revision'])
+            corpus.add_document(doc['id'], index, doc)
+            added += 1
+        
+        self.corpus_synced_at = time.monotonic()
+        return added, len(removed)
     
     def get_queue_size(self) -> int:
         """
         Get number of jobs waiting in queue.
         
         Returns:
-            int: Number of pending jobs
+            int: Number of pending jobs (across all processes sharing the database)
         """
-        return self.job_queue.qsize()
+        return self.job_queue.size()
     
     def list_documents(self, status: str = None):
         """
@@ -358,13 +992,28 @@ class BackgroundProcessor:
             doc_id: Document ID to delete
         
         Note:
-            Also removes from progress callbacks if registered
+            Also removes queued jobs, progress callbacks, the retrieval index cache,
+            the corpus index and any persisted vector index. A document still
+            in the pipeline is cancelled: its remaining windows are dropped
+            and nothing more is written for it
         """
-        # Remove from progress callbacks
-        if doc_id in self.progress_callbacks:
-            del self.progress_callbacks[doc_id]
-        
-        return self.db.delete_document(doc_id)
+        with self.write_lock:
+            run = self.runs.get(doc_id)
+            if run is not None:
+                run.cancelled = True
+            self.job_queue.cancel_document(doc_id)
+            
+            # Remove from progress callbacks
+            if doc_id in self.progress_callbacks:
+                del self.progress_callbacks[doc_id]
+            
+            self.index_cache.invalidate(doc_id)
+            if self.corpus_index is not None:
+                self.corpus_index.remove_document(doc_id)
+            if os.path.exists(self._vector_index_path(doc_id)):
+                os.remove(self._vector_index_path(doc_id))
+            
+            return self.db.delete_document(doc_id)
     
     def get_stats(self):
         """
@@ -376,10 +1025,18 @@ class BackgroundProcessor:
                 - Total chunks
                 - Queue size
                 - Active worker count
+                - Embedding rate limiter state
         """
         stats = self.db.get_stats()
         stats['queue_size'] = self.get_queue_size()
+        stats['documents_in_flight'] = len(self.runs)
+        stats['embed_queue_size'] = self.embed_queue.qsize()
+        stats['write_queue_size'] = self.write_queue.qsize()
+        stats['index_queue_size'] = self.index_queue.qsize()
+        stats.update(self.job_queue.get_stats())
         stats['workers_running'] = len([w for w in self.workers if w.is_alive()])
+        if self.dispatcher:
+            stats.update(self.dispatcher.get_stats())
         return stats
 
 # Global processor instance
@@ -6,31 +6,94 @@ This module manages all data storage and retrieval operations for the RAG system
 including document metadata, text chunks, and vector embeddings.
 
 Key Features:
-- Document deduplication using MD5 hashing
-- Efficient chunk storage with embedding blobs
+- Document deduplication using streamed MD5 or BLAKE2b file hashing
+- Efficient chunk storage with embedding blobs (configurable dtype, float32 by default)
+- Optional memory-mapped sidecar files for embeddings (zero-copy loading,
+  pages shared between processes through the OS cache)
 - Status tracking for async processing
 - Query operations for retrieval and analysis
+- Content-addressed embedding cache shared across documents
+- Compressed extracted-text cache keyed by file hash and extractor version
 - Statistics and monitoring capabilities
+- Per-thread persistent connections in WAL mode (readers never block on writers)
 
 Database Schema:
 - documents table: Stores document metadata and processing status
-- chunks table: Stores text chunks with their embeddings
+- chunks table: Stores text chunks with their embeddings (or their row
+  offsets into a sidecar file)
+- embedding_cache table: Embeddings keyed by (model, normalized text hash)
+- extracted_texts / extracted_pages tables: zlib-compressed page text keyed
+  by (file hash, extractor version)
 - Indexes for efficient querying by status and document_id
 
 Typical usage:
     db = DocumentDatabase()
     doc_id = db.add_document(filename, file_path, file_size, num_pages)
     db.add_chunks(doc_id, chunks_with_embeddings)
-    embeddings_df = db.get_chunks_df(doc_id)
+    arrays = db.get_chunk_arrays(doc_id)  # or db.get_chunks_df(doc_id)
 """
 
 import sqlite3
 import hashlib
 import os
+import threading
+import unicodedata
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterator
 import pandas as pd
 import numpy as np
+import config
+
+# Embedding blobs written before embedding_dtype was recorded are float64
+LEGACY_EMBEDDING_DTYPE = 'float64'
+
+# Chunk columns that can be projected, and the SQL each one reads
+CHUNK_COLUMNS = {
+    'chunk_id': 'chunk_id',
+    'text': 'text',
+    'token_count': 'token_count',
+    'start_sentence': 'COALESCE(start_sentence, -1)',
+    'end_sentence': 'COALESCE(end_sentence, -1)',
+    'embedding': 'embedding, embedding_dtype, embedding_dim, embedding_row'
+}
+
+def _stack_embeddings(blobs: Tuple, dtypes: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assemble embedding blobs into one contiguous float32 matrix.
+    
+    Blobs sharing a dtype are joined and decoded with a single frombuffer(),
+    so the cost is one copy per dtype rather than one array per row.
+    
+    Args:
+        blobs: Embedding blobs, one per chunk (None if not embedded)
+        dtypes: Recorded dtype of each blob (None for legacy float64 rows)
+    
+    Returns:
+        Tuple of (matrix with one row per chunk, boolean has-embedding mask).
+        Rows without an embedding are zero.
+    """
+    n_rows = len(blobs)
+    has_embedding = np.fromiter((blob is not None for blob in blobs), dtype=bool, count=n_rows)
+    dtypes = np.array([dtype or LEGACY_EMBEDDING_DTYPE for dtype in dtypes], dtype=object)
+    
+    # Common case: every row embedded with the same dtype
+    if has_embedding.all() and n_rows and (dtypes == dtypes[0]).all():
+        matrix = np.frombuffer(b''.join(blobs), dtype=dtypes[0]).reshape(n_rows, -1)
+        return matrix.astype(np.float32, copy=False), has_embedding
+    
+    groups = []
+    for dtype in set(dtypes[has_embedding]):
+        rows = np.flatnonzero(has_embedding & (dtypes == dtype))
+        values = np.frombuffer(b''.join(blobs[row] for row in rows), dtype=dtype)
+        groups.append((rows, values.reshape(len(rows), -1)))
+    
+    dim = groups[0][1].shape[1] if groups else 0
+    matrix = np.zeros((n_rows, dim), dtype=np.float32)
+    for rows, values in groups:
+        matrix[rows] = values
+    return matrix, has_embedding
 
 class DocumentDatabase:
     """
@@ -39,15 +102,79 @@ class DocumentDatabase:
     This class provides a complete persistence layer for the RAG system,
     handling document metadata, chunk storage, and embedding management.
     """
-    def __init__(self, db_path: str = "documents.db"):
+    def __init__(self, db_path: str = "documents.db", embedding_storage: str = None):
         """
         Initialize the document database.
         
         Args:
             db_path: Path to SQLite database file (default: "documents.db")
+            embedding_storage: Where new embeddings are written: 'sqlite'
+                (BLOB column) or 'memmap' (sidecar files) (default:
+                config.EMBEDDING_STORAGE)
+        
+        Raises:
+            ValueError: If embedding_storage is not recognized
         """
         self.db_path = db_path
+        self.embedding_storage = embedding_storage or config.EMBEDDING_STORAGE
+        if self.embedding_storage not in ('sqlite', 'memmap'):
+            raise ValueError(f"Unknown embedding storage: {self.embedding_storage}")
+        self.embedding_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)),
+                                          config.EMBEDDING_STORE_DIR)
+        self.local = threading.local()
         self.init_database()
+        
+        # Embedding cache counters (per process)
+        self.cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_writes = 0  # entries written since the cache size was last checked
+    
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Get this thread's persistent connection, opening it on first use.
+        
+        Connections run in WAL mode so readers (the UI) never wait on the
+        ingest worker's writes, with synchronous=NORMAL, an enlarged page
+        cache, memory-mapped reads and a busy timeout for competing writers.
+        
+        Returns:
+            sqlite3.Connection owned by the calling thread
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=config.SQLITE_BUSY_TIMEOUT_MS / 1000)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{int(config.SQLITE_CACHE_SIZE_KB)}")
+            conn.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+            conn.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+            self.local.conn = conn
+        return conn
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Context manager yielding this thread's connection inside a transaction.
+        
+        Commits on normal exit and rolls back if an exception escapes.
+        The connection stays open for reuse by later calls on the same thread.
+        
+        Yields:
+            sqlite3.Connection
+        """
+        conn = self._connect()
+        with conn:
+            yield conn
+    
+    def close(self):
+        """
+        Close the calling thread's connection, if any.
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
     
     def init_database(self):
         """
@@ -56,9 +183,11 @@ class DocumentDatabase:
         Sets up:
         - documents table: Stores document metadata and processing status
         - chunks table: Stores text chunks with embeddings
+        - embedding_cache table: Reusable embeddings keyed by text hash
+        - extracted_texts / extracted_pages tables: Cached PDF page text
         - Indexes for efficient querying
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS documents (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -71,7 +200,9 @@ class DocumentDatabase:
                     status TEXT DEFAULT 'pending',
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     processed_at TIMESTAMP,
-                    error_message TEXT
+                    error_message TEXT,
+                    chunk_params TEXT,
+                    revision INTEGER DEFAULT 0
                 )
             """)
             
@@ -85,12 +216,63 @@ class DocumentDatabase:
                     start_sentence INTEGER,
                     end_sentence INTEGER,
                     embedding BLOB,
+                    embedding_dtype TEXT,
+                    embedding_dim INTEGER,
+                    embedding_row INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (document_id) REFERENCES documents (id),
                     UNIQUE(document_id, chunk_id)
                 )
             """)
             
+            # Databases created before chunking parameters were recorded
+            document_columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+            if 'chunk_params' not in document_columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN chunk_params TEXT")
+            if 'revision' not in document_columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN revision INTEGER DEFAULT 0")
+            
+            # Databases created before embedding dtypes were recorded
+            chunk_columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+            if 'embedding_dtype' not in chunk_columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN embedding_dtype TEXT")
+            if 'embedding_dim' not in chunk_columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN embedding_dim INTEGER")
+            if 'embedding_row' not in chunk_columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN embedding_row INTEGER")
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+            
+            # A document's cached text is complete once its extracted_texts row exists
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS extracted_texts (
+                    file_hash TEXT NOT NULL,
+                    extractor_version TEXT NOT NULL,
+                    num_pages INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (file_hash, extractor_version)
+                )
+            """)
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS extracted_pages (
+                    file_hash TEXT NOT NULL,
+                    extractor_version TEXT NOT NULL,
+                    page_number INTEGER NOT NULL,
+                    text BLOB NOT NULL,
+                    PRIMARY KEY (file_hash, extractor_version, page_number)
+                )
+            """)
+            
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_document_status ON documents(status);
             """)
@@ -98,21 +280,67 @@ class DocumentDatabase:
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id);
             """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_cache_last_used ON embedding_cache(last_used_at);
+            """)
     
-    def get_file_hash(self, file_path: str) -> str:
+    def get_file_hash(self, file_path: str, algorithm: str = None) -> str:
         """
-        Calculate MD5 hash of a file for deduplication.
+        Calculate a content fingerprint of a file for deduplication.
+        
+        The file is streamed through a fixed-size buffer, so memory use stays
+        constant regardless of file size.
         
         Args:
             file_path: Path to the file to hash
+            algorithm: 'md5' or 'blake2b' (default: config.FILE_HASH_ALGORITHM)
         
         Returns:
-            str: MD5 hash hex digest of the file contents
+            str: Hex digest of the file contents. BLAKE2b digests carry a
+                'blake2b:' prefix; MD5 digests are unprefixed, matching
+                documents stored before the algorithm was configurable
+        
+        Raises:
+            ValueError: If the algorithm is not supported
         """
-        with open(file_path, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+        algorithm = algorithm or config.FILE_HASH_ALGORITHM
+        if algorithm == 'md5':
+            hasher, prefix = hashlib.md5(), ''
+        elif algorithm == 'blake2b':
+            hasher, prefix = hashlib.blake2b(), 'blake2b:'
+        else:
+            raise ValueError(f"Unsupported file hash algorithm: {algorithm}")
+        
+        buffer = bytearray(config.FILE_HASH_BLOCK_SIZE)
+        view = memoryview(buffer)
+        with open(file_path, 'rb', buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                hasher.update(view[:size])
+        
+        return prefix + hasher.hexdigest()
     
-    def add_document(self, filename: str, file_path: str, file_size: int, num_pages: int) -> int:
+    def get_text_hash(self, text: str) -> str:
+        """
+        Calculate the embedding cache key for a chunk of text.
+        
+        Text is Unicode-normalized (NFC) and whitespace is collapsed before
+        hashing, so re-extracted text with different line wrapping still hits.
+        
+        Args:
+            text: Chunk text
+        
+        Returns:
+            str: SHA-256 hex digest of the normalized text
+        """
+        normalized = ' '.join(unicodedata.normalize('NFC', text).split())
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    
+    def add_document(self, filename: str, file_path: str, file_size: int, num_pages: int,
+                     file_hash: str = None) -> int:
         """
         Add a new document to the database or return existing document ID.
         
@@ -124,13 +352,15 @@ class DocumentDatabase:
             file_path: Full path to the document file
             file_size: Size of the file in bytes
             num_pages: Number of pages in the document
+            file_hash: Precomputed get_file_hash() fingerprint (computed
+                here if omitted)
         
         Returns:
             int: Document ID (either new or existing)
         """
-        file_hash = self.get_file_hash(file_path)
+        file_hash = file_hash or self.get_file_hash(file_path)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             cursor = conn.execute("""
                 INSERT OR IGNORE INTO documents 
                 (filename, file_hash, original_path, file_size, num_pages, status)
@@ -156,13 +386,16 @@ class DocumentDatabase:
             error_message: Optional error message if status is 'failed'
         
         Note:
-            Sets processed_at timestamp when status is 'completed'
+            Sets processed_at timestamp when status is 'completed', and
+            advances revision to a new database-wide maximum (processed_at
+            has one-second resolution, too coarse to version indexes)
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             if status == 'completed':
                 conn.execute("""
                     UPDATE documents 
-                    SET status = ?, processed_at = CURRENT_TIMESTAMP, error_message = ?
+                    SET status = ?, processed_at = CURRENT_TIMESTAMP, error_message = ?,
+                        revision = (SELECT COALESCE(MAX(revision), 0) + 1 FROM documents)
                     WHERE id = ?
                 """, (status, error_message, doc_id))
             else:
@@ -172,7 +405,7 @@ class DocumentDatabase:
                     WHERE id = ?
                 """, (status, error_message, doc_id))
     
-    def add_chunks(self, doc_id: int, chunks: List[Dict]):
+    def add_chunks(self, doc_id: int, chunks: List[Dict], total_chunks: Optional[int] = None):
         """
         Store text chunks and their embeddings for a document.
         
@@ -185,39 +418,326 @@ class DocumentDatabase:
                 - start_sentence: Starting sentence index
                 - end_sentence: Ending sentence index
                 - embedding: Optional numpy array of the embedding vector
+            total_chunks: Chunk count recorded on the document
+                (default: len(chunks))
         
         Note:
-            - Embeddings are stored as binary blobs for efficiency
-            - Updates the document's total_chunks count after insertion
-        """
-        with sqlite3.connect(self.db_path) as conn:
-            for chunk in chunks:
-                embedding_blob = None
-                if 'embedding' in chunk and chunk['embedding'] is not None:
-                    embedding_blob = np.array(chunk['embedding']).tobytes()
+            - Embeddings are stored as config.EMBEDDING_DTYPE, with the dtype
+              and dimension recorded on each row
+            - With 'memmap' storage the vectors are appended to the
+              document's sidecar file and each row records its offset;
+              otherwise they are stored as BLOBs
+            - All rows are written with a single executemany() in one
+              transaction, so a document's chunks commit atomically
+        """
+        embedded = [chunk for chunk in chunks if chunk.get('embedding') is not None]
+        vectors = np.asarray([chunk['embedding'] for chunk in embedded], dtype=config.EMBEDDING_DTYPE)
+        
+        # Sidecar rows are written before the transaction; rows left behind
+        # by a failed commit are simply never referenced
+        first_row = None
+        if self.embedding_storage == 'memmap' and embedded:
+            first_row = self._append_embeddings(doc_id, vectors)
+        
+        vector_of = {id(chunk): position for position, chunk in enumerate(embedded)}
+        rows = []
+        for chunk in chunks:
+            embedding_blob = None
+            embedding_dtype = None
+            embedding_dim = None
+            embedding_row = None
+            position = vector_of.get(id(chunk))
+            if position is not None:
+                embedding_dtype = vectors.dtype.name
+                embedding_dim = vectors.shape[1]
+                if first_row is None:
+                    embedding_blob = vectors[position].tobytes()
+                else:
+                    embedding_row = first_row + position
+            
+            rows.append((
+                doc_id,
+                chunk['chunk_id'],
+                chunk['text'],
+                chunk['token_count'],
+                chunk.get('start_sentence'),
+                chunk.get('end_sentence'),
+                embedding_blob,
+                embedding_dtype,
+                embedding_dim,
+                embedding_row
+            ))
+        
+        if total_chunks is None:
+            total_chunks = len(rows)
+        
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO chunks 
+                (document_id, chunk_id, text, token_count, start_sentence, end_sentence,
+                 embedding, embedding_dtype, embedding_dim, embedding_row)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            
+            conn.execute("UPDATE documents SET total_chunks = ? WHERE id = ?",
+                         (total_chunks, doc_id))
+    
+    def get_embedding_path(self, doc_id: int, dtype: str) -> str:
+        """
+        Path of a document's embedding sidecar file.
+        
+        Args:
+            doc_id: Document ID
+            dtype: Stored dtype name (part of the file name)
+        
+        Returns:
+            str: Raw row-major file of `dtype` vectors
+        """
+        return os.path.join(self.embedding_dir, f"doc_{doc_id}.{dtype}")
+    
+    def _append_embeddings(self, doc_id: int, vectors: np.ndarray) -> int:
+        """
+        Append vectors to a document's sidecar file.
+        
+        Args:
+            doc_id: Document ID
+            vectors: 2-D array of vectors to append
+        
+        Returns:
+            int: File row of the first appended vector
+        """
+        path = self.get_embedding_path(doc_id, vectors.dtype.name)
+        os.makedirs(self.embedding_dir, exist_ok=True)
+        
+        with open(path, 'ab') as f:
+            first_row = f.seek(0, os.SEEK_END) // vectors[0].nbytes
+            f.write(np.ascontiguousarray(vectors).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        
+        return first_row
+    
+    def _open_embeddings(self, doc_id: int, dtype: str, dim: int) -> np.memmap:
+        """
+        Memory-map a document's sidecar file read-only.
+        
+        Args:
+            doc_id: Document ID
+            dtype: Stored dtype name
+            dim: Vector dimension
+        
+        Returns:
+            np.memmap of shape (rows, dim)
+        """
+        path = self.get_embedding_path(doc_id, dtype)
+        n_rows = os.path.getsize(path) // (dim * np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(n_rows, dim))
+    
+    def _load_embeddings(self, doc_id: int, blobs: Tuple, dtypes: Tuple, dims: Tuple,
+                         file_rows: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Assemble a document's embeddings from BLOBs and/or its sidecar files.
+        
+        When every row lives contiguously in one float32 sidecar file the
+        memory map itself is returned, so loading copies nothing.
+        
+        Args:
+            doc_id: Document ID
+            blobs: Embedding blobs, one per chunk (None if not stored inline)
+            dtypes: Recorded dtype of each row
+            dims: Recorded dimension of each row
+            file_rows: Sidecar row of each chunk (None if not in a sidecar)
+        
+        Returns:
+            Tuple of (matrix with one row per chunk, boolean has-embedding mask)
+        """
+        n_rows = len(blobs)
+        file_rows = np.array([-1 if row is None else row for row in file_rows], dtype=np.int64)
+        in_file = file_rows >= 0
+        if not in_file.any():
+            return _stack_embeddings(blobs, dtypes)
+        
+        dtypes = np.array(dtypes, dtype=object)
+        dim = int(np.asarray(dims, dtype=object)[in_file][0])
+        
+        # Zero-copy: the document's rows form one slice of a float32 file
+        if in_file.all() and (dtypes == 'float32').all() and \
+                np.array_equal(file_rows, file_rows[0] + np.arange(n_rows)):
+            vectors = self._open_embeddings(doc_id, 'float32', dim)
+            return vectors[file_rows[0]:file_rows[0] + n_rows], in_file
+        
+        inline = tuple(None if stored else blob for blob, stored in zip(blobs, in_file))
+        inline_matrix, has_inline = _stack_embeddings(inline, tuple(dtypes))
+        
+        matrix = np.zeros((n_rows, dim), dtype=np.float32)
+        if has_inline.any():
+            matrix[has_inline] = inline_matrix[has_inline]
+        for dtype in set(dtypes[in_file]):
+            rows = np.flatnonzero(in_file & (dtypes == dtype))
+            matrix[rows] = self._open_embeddings(doc_id, dtype, dim)[file_rows[rows]]
+        
+        return matrix, has_inline | in_file
+    
+    def get_cached_embeddings(self, model: str, text_hashes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Look up cached embeddings by text hash.
+        
+        Args:
+            model: Embedding model name
+            text_hashes: Hashes from get_text_hash()
+        
+        Returns:
+            Dict mapping each cached hash to its embedding vector
+        
+        Note:
+            Hits refresh last_used_at so eviction removes the least recently
+            used entries first
+        """
+        unique_hashes = list(dict.fromkeys(text_hashes))
+        found = {}
+        
+        with self.connection() as conn:
+            # Stay well below SQLite's bound parameter limit
+            for i in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
                 
+                results = conn.execute(f"""
+                    SELECT text_hash, embedding FROM embedding_cache
+                    WHERE model = ? AND text_hash IN ({placeholders})
+                """, [model] + batch).fetchall()
+                
+                for text_hash, blob in results:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+            
+            if found:
+                conn.executemany("""
+                    UPDATE embedding_cache SET last_used_at = CURRENT_TIMESTAMP
+                    WHERE model = ? AND text_hash = ?
+                """, [(model, text_hash) for text_hash in found])
+        
+        with self.cache_lock:
+            self.cache_hits += len(found)
+            self.cache_misses += len(unique_hashes) - len(found)
+        
+        return found
+    
+    def cache_embeddings(self, model: str, embeddings: Dict[str, List[float]]):
+        """
+        Store embeddings in the cache and evict the oldest entries if needed.
+        
+        Args:
+            model: Embedding model name
+            embeddings: Dict mapping text hash to embedding vector
+        
+        Note:
+            - Vectors are cached as float32
+            - The cache is capped at config.EMBEDDING_CACHE_MAX_ENTRIES rows;
+              least recently used entries are evicted first
+            - The size is only checked every config.EMBEDDING_CACHE_EVICT_INTERVAL
+              written entries, so the cap can be exceeded by up to that many
+        """
+        if not embeddings:
+            return
+        
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding)
+                VALUES (?, ?, ?)
+            """, [
+                (model, text_hash, np.asarray(embedding, dtype=np.float32).tobytes())
+                for text_hash, embedding in embeddings.items()
+            ])
+            
+            # Counting rows scans the table; do it (and evict) in batches
+            with self.cache_lock:
+                self.cache_writes += len(embeddings)
+                if self.cache_writes < config.EMBEDDING_CACHE_EVICT_INTERVAL:
+                    return
+                self.cache_writes = 0
+            
+            excess = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] \
+                - config.EMBEDDING_CACHE_MAX_ENTRIES
+            
+            if excess > 0:
                 conn.execute("""
-                    INSERT OR REPLACE INTO chunks 
-                    (document_id, chunk_id, text, token_count, start_sentence, end_sentence, embedding)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    doc_id,
-                    chunk['chunk_id'],
-                    chunk['text'],
-                    chunk['token_count'],
-                    chunk.get('start_sentence'),
-                    chunk.get('end_sentence'),
-                    embedding_blob
-                ))
-            
-            # Update total chunks count
-            conn.execute("""
-                UPDATE documents 
-                SET total_chunks = (
-                    SELECT COUNT(*) FROM chunks WHERE document_id = ?
-                )
-                WHERE id = ?
-            """, (doc_id, doc_id))
+                    DELETE FROM embedding_cache WHERE rowid IN (
+                        SELECT rowid FROM embedding_cache ORDER BY last_used_at LIMIT ?
+                    )
+                """, (excess,))
+    
+    def has_extracted_text(self, file_hash: str, extractor_version: str) -> bool:
+        """
+        Check whether a file's extracted text is fully cached.
+        
+        Args:
+            file_hash: Fingerprint from get_file_hash()
+            extractor_version: pdf_loader.EXTRACTOR_VERSION
+        
+        Returns:
+            bool: True if every page is cached
+        """
+        with self.connection() as conn:
+            return conn.execute("""
+                SELECT 1 FROM extracted_texts WHERE file_hash = ? AND extractor_version = ?
+            """, (file_hash, extractor_version)).fetchone() is not None
+    
+    def add_extracted_pages(self, file_hash: str, extractor_version: str,
+                            pages: List[Tuple[int, str]], num_pages: int = None):
+        """
+        Cache extracted page text, zlib-compressed.
+        
+        Pages can be written in several calls while extraction is running;
+        passing num_pages with the last call marks the text complete.
+        
+        Args:
+            file_hash: Fingerprint from get_file_hash()
+            extractor_version: pdf_loader.EXTRACTOR_VERSION
+            pages: List of (page_number, page_text)
+            num_pages: Total page count, given once all pages are written
+        """
+        with self.connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO extracted_pages
+                (file_hash, extractor_version, page_number, text)
+                VALUES (?, ?, ?, ?)
+            """, [(file_hash, extractor_version, page_number, zlib.compress(page_text.encode('utf-8')))
+                  for page_number, page_text in pages])
+            
+            if num_pages is not None:
+                conn.execute("""
+                    INSERT OR REPLACE INTO extracted_texts (file_hash, extractor_version, num_pages)
+                    VALUES (?, ?, ?)
+                """, (file_hash, extractor_version, num_pages))
+    
+    def iter_extracted_pages(self, file_hash: str, extractor_version: str,
+                             batch_size: int = 100) -> Iterator[Tuple[int, str]]:
+        """
+        Stream cached page text in page order.
+        
+        Args:
+            file_hash: Fingerprint from get_file_hash()
+            extractor_version: pdf_loader.EXTRACTOR_VERSION
+            batch_size: Pages read per query
+        
+        Yields:
+            Tuple of (page_number, page_text), as PDFLoader.iter_pages() does
+        """
+        last_page = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute("""
+                    SELECT page_number, text FROM extracted_pages
+                    WHERE file_hash = ? AND extractor_version = ? AND page_number > ?
+                    ORDER BY page_number LIMIT ?
+                """, (file_hash, extractor_version, last_page, batch_size)).fetchall()
+            
+            if not rows:
+                return
+            
+            for page_number, blob in rows:
+                yield page_number, zlib.decompress(blob).decode('utf-8')
+            last_page = rows[-1][0]
     
     def get_document_by_id(self, doc_id: int) -> Optional[Dict]:
         """
@@ -229,9 +749,10 @@ class DocumentDatabase:
         Returns:
             Dict with document metadata or None if not found
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            result = conn.execute("""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            result = cursor.execute("""
                 SELECT * FROM documents WHERE id = ?
             """, (doc_id,)).fetchone()
             
@@ -239,6 +760,49 @@ class DocumentDatabase:
                 return dict(result)
             return None
     
+    def get_documents_by_ids(self, doc_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Retrieve the metadata of selected documents.
+        
+        Args:
+            doc_ids: Document IDs to retrieve
+        
+        Returns:
+            Dict mapping document ID to metadata (missing documents are omitted)
+        """
+        unique_ids = list(dict.fromkeys(int(doc_id) for doc_id in doc_ids))
+        documents = {}
+        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            for i in range(0, len(unique_ids), 500):
+                batch = unique_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                
+                results = cursor.execute(f"""
+                    SELECT * FROM documents WHERE id IN ({placeholders})
+                """, batch).fetchall()
+                
+                documents.update((row['id'], dict(row)) for row in results)
+        
+        return documents
+    
+    def get_document_revisions(self, status: str = 'completed') -> Dict[int, int]:
+        """
+        Get the revision of every document with a given status.
+        
+        Args:
+            status: Document status (default: 'completed')
+        
+        Returns:
+            Dict mapping document ID to revision
+        """
+        with self.connection() as conn:
+            return dict(conn.execute("""
+                SELECT id, revision FROM documents WHERE status = ?
+            """, (status,)).fetchall())
+    
     def get_documents(self, status: str = None) -> List[Dict]:
         """
         Retrieve all documents, optionally filtered by status.
@@ -249,72 +813,274 @@ class DocumentDatabase:
         Returns:
             List of document dictionaries ordered by creation date (newest first)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             if status:
-                results = conn.execute("""
+                results = cursor.execute("""
                     SELECT * FROM documents WHERE status = ? ORDER BY created_at DESC
                 """, (status,)).fetchall()
             else:
-                results = conn.execute("""
+                results = cursor.execute("""
                     SELECT * FROM documents ORDER BY created_at DESC
                 """).fetchall()
             
             return [dict(row) for row in results]
     
-    def get_chunks_df(self, doc_id: int) -> pd.DataFrame:
+    def get_chunk_arrays(self, doc_id: int, columns: List[str] = None) -> Dict[str, np.ndarray]:
         """
-        Retrieve all chunks and embeddings for a document as a DataFrame.
+        Retrieve the chunks of a document as aligned column arrays.
         
-        This is the primary method for loading processed document data
-        for RAG operations.
+        Only the requested columns are read from SQLite. Embeddings are
+        assembled into one contiguous 2-D matrix in a single pass, without
+        building a Python object per row; embeddings kept in a sidecar file
+        are returned as a read-only memory map where possible.
         
         Args:
             doc_id: Document ID to retrieve chunks for
+            columns: Columns to load (default: all of CHUNK_COLUMNS);
+                chunk_id is always included
         
         Returns:
-            pd.DataFrame with columns:
+            Dict of the requested arrays, one element/row per chunk in
+            chunk_id order:
+                - chunk_id: int64 chunk identifiers
+                - text: Chunk texts (object array)
+                - token_count: int64 token counts
+                - start_sentence: int64 starting sentence index (-1 if unknown)
+                - end_sentence: int64 ending sentence index (-1 if unknown)
+                - embedding: float32 matrix of shape (chunks, dim)
+                - has_embedding: bool mask of rows that have an embedding
+                  (returned with embedding)
+        
+        Raises:
+            ValueError: If an unknown column is requested
+        
+        Note:
+            Rows with different stored dtypes (e.g. legacy float64 rows next
+            to float32 ones) are decoded per dtype and merged.
+        """
+        columns = list(CHUNK_COLUMNS) if columns is None else list(dict.fromkeys(['chunk_id'] + list(columns)))
+        unknown = [column for column in columns if column not in CHUNK_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown chunk columns: {unknown}")
+        
+        with self.connection() as conn:
+            rows = conn.execute(f"""
+                SELECT {', '.join(CHUNK_COLUMNS[column] for column in columns)}
+                FROM chunks 
+                WHERE document_id = ? 
+                ORDER BY chunk_id
+            """, (doc_id,)).fetchall()
+        
+        # The embedding column reads four fields (blob, dtype, dim, sidecar row)
+        n_fields = len(columns) + 3 * ('embedding' in columns)
+        values = list(zip(*rows)) if rows else [()] * n_fields
+        
+        arrays = {}
+        position = 0
+        for column in columns:
+            if column == 'embedding':
+                arrays['embedding'], arrays['has_embedding'] = self._load_embeddings(
+                    doc_id, *values[position:position + 4])
+                position += 4
+                continue
+            
+            if column == 'text':
+                arrays['text'] = np.empty(len(values[position]), dtype=object)
+                arrays['text'][:] = values[position]
+            else:
+                arrays[column] = np.array(values[position], dtype=np.int64)
+            position += 1
+        
+        return arrays
+    
+    def get_chunk_texts(self, doc_id: int, chunk_ids: List[int]) -> Dict[int, str]:
+        """
+        Fetch the text of selected chunks only.
+        
+        Used by retrieval to load text for the handful of chunks a query
+        selects instead of keeping every chunk's text in memory.
+        
+        Args:
+            doc_id: Document ID
+            chunk_ids: Chunk identifiers to fetch
+        
+        Returns:
+            Dict mapping chunk_id to text (missing chunks are omitted)
+        """
+        unique_ids = list(dict.fromkeys(int(chunk_id) for chunk_id in chunk_ids))
+        texts = {}
+        
+        with self.connection() as conn:
+            for i in range(0, len(unique_ids), 500):
+                batch = unique_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                
+                results = conn.execute(f"""
+                    SELECT chunk_id, text FROM chunks
+                    WHERE document_id = ? AND chunk_id IN ({placeholders})
+                """, [doc_id] + batch).fetchall()
+                
+                texts.update(results)
+        
+        return texts
+    
+    def get_chunks_df(self, doc_id: int, columns: List[str] = None) -> pd.DataFrame:
+        """
+        Retrieve chunks and embeddings for a document as a DataFrame.
+        
+        Convenience wrapper around get_chunk_arrays() for callers that
+        want a DataFrame; retrieval code should use the arrays directly.
+        
+        Args:
+            doc_id: Document ID to retrieve chunks for
+            columns: Columns to load (default: all); chunk_id is always included
+        
+        Returns:
+            pd.DataFrame with the requested columns out of:
                 - chunk_id: Sequential chunk identifier
                 - text: Chunk text content
                 - token_count: Number of tokens
                 - start_sentence: Starting sentence index
                 - end_sentence: Ending sentence index
-                - embedding: Numpy array of the embedding vector
+                - embedding: Numpy array of the embedding vector (a row view
+                  of the contiguous matrix), or None
         
         Note:
-            Returns empty DataFrame if no chunks found
+            - Returns empty DataFrame if no chunks found
+            - Rows written before dtypes were recorded are read as float64
+            - Pass columns=['token_count'] for statistics; it skips the
+              text and embedding blobs entirely
         """
-        with sqlite3.connect(self.db_path) as conn:
-            query = """
-                SELECT chunk_id, text, token_count, start_sentence, end_sentence, embedding
-                FROM chunks 
-                WHERE document_id = ? 
-                ORDER BY chunk_id
-            """
-            
-            results = conn.execute(query, (doc_id,)).fetchall()
-            
-            if not results:
-                return pd.DataFrame()
-            
-            data = []
-            for row in results:
-                chunk_data = {
-                    'chunk_id': row[0],
-                    'text': row[1],
-                    'token_count': row[2],
-                    'start_sentence': row[3],
-                    'end_sentence': row[4]
-                }
+        arrays = self.get_chunk_arrays(doc_id, columns)
+        if not len(arrays['chunk_id']):
+            return pd.DataFrame()
+        
+        if 'embedding' in arrays:
+            arrays['embedding'] = [row if present else None
+                                   for row, present in zip(arrays['embedding'], arrays.pop('has_embedding'))]
+        
+        return pd.DataFrame(arrays)
+    
+    def migrate_embedding_dtype(self, dtype: str = None, batch_size: int = 1000) -> int:
+        """
+        Rewrite stored embeddings in place to a new dtype.
+        
+        Converts every chunk whose embedding is not already stored as
+        `dtype`, including legacy float64 rows with no recorded dtype.
+        
+        Args:
+            dtype: Target dtype name (default: config.EMBEDDING_DTYPE)
+            batch_size: Rows converted per transaction
+        
+        Returns:
+            int: Number of chunks rewritten
+        
+        Note:
+            SQLite does not return freed pages to the filesystem until the
+            database is vacuumed (see vacuum())
+        """
+        dtype = np.dtype(dtype or config.EMBEDDING_DTYPE).name
+        converted = 0
+        last_id = 0
+        
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute("""
+                    SELECT id, embedding, embedding_dtype FROM chunks
+                    WHERE id > ? AND embedding IS NOT NULL
+                      AND (embedding_dtype IS NULL OR embedding_dtype != ?)
+                    ORDER BY id LIMIT ?
+                """, (last_id, dtype, batch_size)).fetchall()
                 
-                if row[5]:  # embedding blob exists
-                    embedding = np.frombuffer(row[5], dtype=np.float64)
-                    chunk_data['embedding'] = embedding
+                if not rows:
+                    return converted
                 
-                data.append(chunk_data)
-            
-            return pd.DataFrame(data)
+                updates = []
+                for row_id, blob, row_dtype in rows:
+                    embedding = np.frombuffer(blob, dtype=row_dtype or LEGACY_EMBEDDING_DTYPE).astype(dtype)
+                    updates.append((embedding.tobytes(), dtype, embedding.shape[0], row_id))
+                
+                conn.executemany("""
+                    UPDATE chunks SET embedding = ?, embedding_dtype = ?, embedding_dim = ?
+                    WHERE id = ?
+                """, updates)
+                
+                converted += len(rows)
+                last_id = rows[-1][0]
+    
+    def vacuum(self):
+        """
+        Rebuild the database file to reclaim space freed by deletes and migrations.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    
+    def get_embedded_chunk_ids(self, doc_id: int) -> np.ndarray:
+        """
+        Chunk IDs of a document whose embeddings are already stored.
+        
+        Used to resume an interrupted ingestion without re-embedding
+        checkpointed chunks.
+        
+        Args:
+            doc_id: Document ID
+        
+        Returns:
+            np.ndarray of chunk_ids (int64), ascending
+        """
+        with self.connection() as conn:
+            rows = conn.execute("""
+                SELECT chunk_id FROM chunks
+                WHERE document_id = ? AND (embedding IS NOT NULL OR embedding_row IS NOT NULL)
+                ORDER BY chunk_id
+            """, (doc_id,)).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+    
+    def set_chunk_params(self, doc_id: int, chunk_params: str):
+        """
+        Record the chunking parameters a document's chunks were cut with.
+        
+        Args:
+            doc_id: Document ID
+            chunk_params: Opaque description (chunk size, overlap, extractor)
+        """
+        with self.connection() as conn:
+            conn.execute("UPDATE documents SET chunk_params = ? WHERE id = ?", (chunk_params, doc_id))
+    
+    def delete_chunks(self, doc_id: int):
+        """
+        Delete all chunks of a document, keeping the document row.
+        
+        Args:
+            doc_id: Document ID
+        
+        Note:
+            Also removes the document's embedding sidecar files
+        """
+        with self.connection() as conn:
+            sidecar_paths = self._delete_chunk_rows(conn, doc_id)
+            conn.execute("UPDATE documents SET total_chunks = 0 WHERE id = ?", (doc_id,))
+        self._remove_files(sidecar_paths)
+    
+    def _delete_chunk_rows(self, conn: sqlite3.Connection, doc_id: int) -> List[str]:
+        # Returns the sidecar files to remove once the transaction commits
+        sidecar_dtypes = [row[0] for row in conn.execute("""
+            SELECT DISTINCT embedding_dtype FROM chunks
+            WHERE document_id = ? AND embedding_row IS NOT NULL
+        """, (doc_id,))]
+        conn.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+        return [self.get_embedding_path(doc_id, dtype) for dtype in sidecar_dtypes]
+    
+    def _remove_files(self, paths: List[str]):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
     
     def delete_document(self, doc_id: int):
         """
@@ -324,11 +1090,18 @@ class DocumentDatabase:
             doc_id: Document ID to delete
         
         Note:
-            Cascades to delete all associated chunks
+            Cascades to delete all associated chunks and sidecar files, and
+            the file's cached extracted text once no document refers to it
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+        with self.connection() as conn:
+            sidecar_paths = self._delete_chunk_rows(conn, doc_id)
+            row = conn.execute("SELECT file_hash FROM documents WHERE id = ?", (doc_id,)).fetchone()
             conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            
+            if row and not conn.execute("SELECT 1 FROM documents WHERE file_hash = ?", (row[0],)).fetchone():
+                conn.execute("DELETE FROM extracted_pages WHERE file_hash = ?", (row[0],))
+                conn.execute("DELETE FROM extracted_texts WHERE file_hash = ?", (row[0],))
+        self._remove_files(sidecar_paths)
     
     def get_stats(self) -> Dict:
         """
@@ -339,8 +1112,10 @@ class DocumentDatabase:
                 - {status}_documents: Count of documents by status
                 - total_chunks: Total number of chunks across all documents
                 - avg_processing_time_minutes: Average time to process completed docs
+                - embedding_cache_entries/hits/misses: Embedding cache usage
+                - extracted_text_entries: Files with cached extracted text
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connection() as conn:
             stats = {}
             
             # Document counts by status
@@ -365,4 +1140,46 @@ class DocumentDatabase:
             if result[0]:
                 stats['avg_processing_time_minutes'] = round(result[0], 2)
             
-            return stats
\ No newline at end of file
+            # Embedding cache
+            result = conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()
+            stats['embedding_cache_entries'] = result[0]
+            
+            # Extracted-text cache
+            result = conn.execute("SELECT COUNT(*) FROM extracted_texts").fetchone()
+            stats['extracted_text_entries'] = result[0]
+            
+            with self.cache_lock:
+                stats['embedding_cache_hits'] = self.cache_hits
+                stats['embedding_cache_misses'] = self.cache_misses
+            
+            return stats
+
+def main():
+    """
+    Command-line maintenance entry point.
+    
+    Usage:
+        python -m src.database migrate-embeddings [--dtype float32] [--vacuum]
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="RAG document database maintenance")
+    parser.add_argument('--db', default="documents.db", help="Path to the SQLite database")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    migrate = subparsers.add_parser('migrate-embeddings', help="Rewrite stored embeddings to a new dtype")
+    migrate.add_argument('--dtype', default=config.EMBEDDING_DTYPE, help="Target dtype (default: %(default)s)")
+    migrate.add_argument('--vacuum', action='store_true', help="Vacuum the database afterwards to reclaim space")
+    
+    args = parser.parse_args()
+    db = DocumentDatabase(args.db)
+    
+    if args.command == 'migrate-embeddings':
+        converted = db.migrate_embedding_dtype(args.dtype)
+        print(f"Converted {converted} embeddings to {args.dtype}")
+        if args.vacuum:
+            db.vacuum()
+            print("Vacuumed database")
+
+if __name__ == "__main__":
+    main()
@@ -6,32 +6,56 @@ This module is the core of the RAG system's retrieval capabilities.
 
 Key Features:
 - Semantic-aware text chunking with configurable overlap
-- OpenAI embedding generation for each chunk
-- Cosine similarity search with neighbor context inclusion
+- Streaming chunker that cuts chunks while pages are still being extracted
+- Batched OpenAI embedding generation (many chunks per request)
+- Cosine similarity search over a cached, pre-normalized RetrievalIndex
+  with partial top-k selection and neighbor context inclusion
 - Token counting for context window management
 
 Chunking Strategy:
 - Splits text at sentence boundaries to preserve meaning
-- Maintains overlap between chunks for context continuity
+- Tokenizes each document once and cuts chunks by token offset
+- Maintains an exact token overlap between chunks for context continuity
 - Tracks token counts to stay within model limits
 - Preserves sentence indices for citation purposes
 
 Typical usage:
     embedder = DocumentEmbedder(openai_client)
     chunks = embedder.chunk_text(document_text)
+    # or: chunks = embedder.chunk_pages(loader.iter_pages(pdf_file))
     embeddings_df = embedder.generate_embeddings(chunks)
     similar = embedder.find_similar_chunks(query, embeddings_df)
 """
 
+import re
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterable, Iterator, Union
 import tiktoken
 from openai import OpenAI
-from sklearn.metrics.pairwise import cosine_similarity
 import streamlit as st
+from .retrieval_index import RetrievalIndex, CorpusIndex
+from .pdf_loader import PAGE_MARKER
 import config
 
+# Streaming chunker: tokens this close to the end of the text received so
+# far are not cut yet, as the tokenizer may merge them with the next page
+_STREAM_TAIL_TOKENS = 16
+
+def _char_start(data: bytes, offset: int) -> int:
+    # Back up over UTF-8 continuation bytes to the start of a character
+    offset = int(offset)
+    while 0 < offset < len(data) and (data[offset] & 0xC0) == 0x80:
+        offset -= 1
+    return offset
+
+def _char_end(data: bytes, offset: int) -> int:
+    # Advance over continuation bytes to the end of a character
+    offset = int(offset)
+    while offset < len(data) and (data[offset] & 0xC0) == 0x80:
+        offset += 1
+    return offset
+
 class DocumentEmbedder:
     """
     Manages document chunking, embedding generation, and similarity search.
@@ -53,14 +77,15 @@ class DocumentEmbedder:
         self.encoding = tiktoken.encoding_for_model(config.EMBEDDING_MODEL)
         self.chunk_size = config.CHUNK_SIZE
         self.overlap = config.CHUNK_OVERLAP
-        
+    
     def chunk_text(self, text: str, chunk_size: int = None, overlap: int = None) -> List[Dict]:
         """
         Split text into overlapping chunks at sentence boundaries.
         
         Implements semantic-aware chunking that respects sentence boundaries
-        to preserve meaning and context. Includes configurable overlap to
-        maintain continuity between chunks.
+        to preserve meaning and context. The document is tokenized once and
+        sentence boundaries are mapped to token offsets, so chunks and their
+        overlaps are cut by slicing a single token array.
         
         Args:
             text: Document text to chunk
@@ -76,46 +101,221 @@ class DocumentEmbedder:
                 - end_sentence: Index of last sentence
         
         Note:
-            Overlap is approximated by including ~overlap/50 sentences
-            from the previous chunk
+            - Chunks end at the last sentence boundary that fits and lies more
+              than `overlap` tokens in (past the previous chunk's end);
+              otherwise (long sentences) they are cut mid-sentence at chunk_size
+            - Each chunk after the first starts with exactly `overlap` tokens
+              of the previous chunk, so it may begin mid-sentence
+            - Sentences are delimited by '. ' and indexed from 0
         """
         chunk_size = chunk_size or self.chunk_size
-        overlap = overlap or self.overlap
+        overlap = self.overlap if overlap is None else overlap
         
-        sentences = text.split('. ')
-        chunks = []
-        current_chunk = ""
-        current_tokens = 0
-        chunk_id = 0
+        chunks, _, _ = self._cut_chunks(text, chunk_size, overlap, final=True)
+        return chunks
+    
+    def chunk_pages(self, pages: Iterable[Tuple[int, str]], chunk_size: int = None,
+                    overlap: int = None) -> Iterator[Dict]:
+        """
+        Chunk a document incrementally as its pages arrive.
         
-        for i, sentence in enumerate(sentences):
-            sentence_tokens = len(self.encoding.encode(sentence))
-            
-            if current_tokens + sentence_tokens > chunk_size and current_chunk:
-                chunks.append({
-                    'chunk_id': chunk_id,
-                    'text': current_chunk.strip(),
-                    'token_count': current_tokens,
-                    'start_sentence': i - len(current_chunk.split('. ')) + 1,
-                    'end_sentence': i - 1
-                })
-                
-                overlap_sentences = current_chunk.split('. ')[-max(1, overlap // 50):]
-                current_chunk = '. '.join(overlap_sentences) + '. ' + sentence + '. '
-                current_tokens = len(self.encoding.encode(current_chunk))
-                chunk_id += 1
+        Streaming counterpart of chunk_text() for PDFLoader.iter_pages():
+        each chunk is yielded as soon as enough text has arrived to fill it,
+        and only the text after the last emitted chunk's overlap is kept,
+        so memory is bounded by chunk and page size rather than document size.
+        
+        Args:
+            pages: Iterable of (page_number, page_text)
+            chunk_size: Maximum tokens per chunk (default: config.CHUNK_SIZE)
+            overlap: Token overlap between chunks (default: config.CHUNK_OVERLAP)
+        
+        Yields:
+            Chunk dictionaries as produced by chunk_text(), in order
+        
+        Note:
+            Page text is joined with the same "--- Page N ---" markers as
+            PDFLoader.load_pdf(), and chunks are cut by the same rules as
+            chunk_text(), including at characters split across tokens and
+            at cuts between '.' and ' '; boundaries can differ by a token
+            only where the tokenizer would have merged across a cut.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        overlap = self.overlap if overlap is None else overlap
+        
+        pending = ""
+        next_chunk_id = 0
+        state = {'first_sentence': 0, 'after_period': False, 'lead_bytes': 0}
+        
+        for page_number, page_text in pages:
+            pending += PAGE_MARKER.format(page_number) + page_text
+            chunks, consumed, next_state = self._cut_chunks(pending, chunk_size, overlap, next_chunk_id,
+                                                            final=False, **state)
+            if consumed:
+                next_state['after_period'] = pending[consumed - 1] == '.'
+                pending = pending[consumed:]
             else:
-                current_chunk += sentence + '. '
-                current_tokens += sentence_tokens
+                next_state['after_period'] = state['after_period']
+            state = next_state
+            next_chunk_id += len(chunks)
+            yield from chunks
         
-        if current_chunk.strip():
+        chunks, _, _ = self._cut_chunks(pending, chunk_size, overlap, next_chunk_id, final=True, **state)
+        yield from chunks
+    
+    def _cut_chunks(self, text: str, chunk_size: int, overlap: int, first_chunk_id: int = 0,
+                    first_sentence: int = 0, after_period: bool = False, lead_bytes: int = 0,
+                    final: bool = True) -> Tuple[List[Dict], int, Dict]:
+        """
+        Cut chunks from text; shared by chunk_text() and chunk_pages().
+        
+        Args:
+            text: Text to chunk, starting at a chunk boundary
+            chunk_size: Maximum tokens per chunk
+            overlap: Token overlap between chunks
+            first_chunk_id: chunk_id of the first chunk produced
+            first_sentence: Sentence index of the start of `text`
+            after_period: Whether the text before `text` ended with '.', so a
+                leading space ends a sentence
+            lead_bytes: Bytes of `text` before the first chunk's first token
+                (the start of a character split across tokens)
+            final: Whether `text` runs to the end of the document. If not,
+                only chunks that are full (and clear of the tokenizer's view
+                of the unfinished tail) are cut.
+        
+        Returns:
+            Tuple of (chunks, characters of `text` consumed, state). Unconsumed
+            text starts the next chunk; state holds the first_sentence and
+            lead_bytes arguments for cutting it.
+        """
+        overlap = min(overlap, chunk_size - 1)
+        
+        tokens = self.encoding.encode(text)
+        if not tokens:
+            return [], len(text), {'first_sentence': first_sentence, 'lead_bytes': 0}
+        
+        # Byte span of every token within the UTF-8 encoded text
+        text_bytes = text.encode('utf-8')
+        token_ends = np.cumsum([len(t) for t in self.encoding.decode_tokens_bytes(tokens)])
+        token_starts = np.concatenate(([0], token_ends[:-1]))
+        
+        # Token offset at which each sentence starts
+        sentence_bytes = [0] + [m.end() for m in re.finditer(rb'\. ', text_bytes)]
+        if after_period and text_bytes.startswith(b' '):
+            sentence_bytes.insert(1, 1)
+        sentence_bytes = np.array(sentence_bytes)
+        sentence_tokens = np.searchsorted(token_ends, sentence_bytes, side='right')
+        
+        def sentence_of(token: int) -> int:
+            return first_sentence + int(np.searchsorted(sentence_tokens, token, side='right')) - 1
+        
+        # Tokens near an unfinished tail may still merge with text to come
+        n_tokens = len(tokens)
+        cut_limit = n_tokens if final else n_tokens - _STREAM_TAIL_TOKENS
+        chunks = []
+        start = int(np.searchsorted(token_ends, lead_bytes, side='right'))
+        
+        while start + (0 if final else chunk_size) < cut_limit:
+            limit = start + chunk_size
+            # A chunk must extend past the previous chunk's end (start + overlap),
+            # or chunks would repeat; without a sentence boundary beyond it, cut
+            # at the size limit
+            min_end = start + overlap
+            if limit >= n_tokens:
+                end = n_tokens
+            else:
+                boundary = sentence_tokens[np.searchsorted(sentence_tokens, limit, side='right') - 1]
+                end = int(boundary) if boundary > min_end else limit
+            
+            # Widened to whole characters, so a character split across
+            # tokens is kept (streaming restarts at its first byte too)
+            chunk_bytes = text_bytes[_char_start(text_bytes, token_starts[start]):
+                                     _char_end(text_bytes, token_ends[end - 1])]
             chunks.append({
-                'chunk_id': chunk_id,
-                'text': current_chunk.strip(),
-                'token_count': current_tokens,
-                'start_sentence': len(sentences) - len(current_chunk.split('. ')),
-                'end_sentence': len(sentences) - 1
+                'chunk_id': first_chunk_id + len(chunks),
+                'text': chunk_bytes.decode('utf-8', errors='ignore').strip(),
+                'token_count': end - start,
+                'start_sentence': sentence_of(start),
+                'end_sentence': sentence_of(end - 1)
             })
+            
+            if end >= n_tokens:
+                return chunks, len(text), {'first_sentence': sentence_of(end - 1), 'lead_bytes': 0}
+            start = max(end - overlap, start + 1)
+        
+        # Hand back the text from the next chunk's start, at a character
+        # boundary, with the index of the sentence in progress there
+        offset = _char_start(text_bytes, token_starts[start])
+        sentence = first_sentence + int(np.searchsorted(sentence_bytes, offset, side='right')) - 1
+        return chunks, len(text_bytes[:offset].decode('utf-8')), \
+            {'first_sentence': sentence, 'lead_bytes': int(token_starts[start]) - offset}
+    
+    def batch_chunks(self, chunks: List[Dict], batch_size: int = None,
+                     max_tokens: int = None) -> Iterator[List[Dict]]:
+        """
+        Group chunks into batches for the embeddings endpoint.
+        
+        Packs consecutive chunks into a single request until either the
+        item cap or the per-request token budget would be exceeded.
+        
+        Args:
+            chunks: List of chunk dictionaries from chunk_text()
+            batch_size: Maximum chunks per request (default: config.EMBEDDING_BATCH_SIZE)
+            max_tokens: Token budget per request (default: config.EMBEDDING_BATCH_MAX_TOKENS)
+        
+        Yields:
+            Lists of chunks, in document order
+        
+        Note:
+            A chunk larger than the token budget is sent in a batch of its own
+        """
+        batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        max_tokens = max_tokens or config.EMBEDDING_BATCH_MAX_TOKENS
+        
+        batch = []
+        batch_tokens = 0
+        
+        for chunk in chunks:
+            chunk_tokens = chunk.get('token_count', 0)
+            
+            if batch and (len(batch) >= batch_size or batch_tokens + chunk_tokens > max_tokens):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            
+            batch.append(chunk)
+            batch_tokens += chunk_tokens
+        
+        if batch:
+            yield batch
+    
+    def embed_batch(self, chunks: List[Dict]) -> List[Dict]:
+        """
+        Embed a batch of chunks with a single API request.
+        
+        Args:
+            chunks: Batch of chunk dictionaries (see batch_chunks())
+        
+        Returns:
+            The same chunks, in the same order, each with an 'embedding' key added
+        
+        Raises:
+            Exception: If the API call fails or returns an incomplete batch
+        """
+        response = self.client.embeddings.create(
+            model=config.EMBEDDING_MODEL,
+            input=[chunk['text'] for chunk in chunks]
+        )
+        
+        # The API reports each vector's input position; don't rely on ordering
+        embeddings = [None] * len(chunks)
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        
+        if any(embedding is None for embedding in embeddings):
+            raise Exception(f"Embedding response returned {len(response.data)} of {len(chunks)} vectors")
+        
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk['embedding'] = embedding
         
         return chunks
     
@@ -123,8 +323,9 @@ class DocumentEmbedder:
         """
         Generate OpenAI embeddings for text chunks.
         
-        Processes chunks through OpenAI's embedding API to create
-        vector representations for similarity search.
+        Processes chunks through OpenAI's embedding API in batches
+        (see batch_chunks()) to create vector representations for
+        similarity search.
         
         Args:
             chunks: List of chunk dictionaries from chunk_text()
@@ -140,47 +341,43 @@ class DocumentEmbedder:
         
         Note:
             - Shows progress bar in Streamlit UI
-            - Continues processing even if individual chunks fail
+            - Continues processing even if individual batches fail
             - Uses text-embedding-3-small model by default
         """
         embeddings_data = []
+        processed = 0
         
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        for i, chunk in enumerate(chunks):
+        for batch in self.batch_chunks(chunks):
             try:
-                response = self.client.embeddings.create(
-                    model=config.EMBEDDING_MODEL,
-                    input=chunk['text']
-                )
-                
-                embedding = response.data[0].embedding
-                
-                embeddings_data.append({
-                    'chunk_id': chunk['chunk_id'],
-                    'text': chunk['text'],
-                    'token_count': chunk['token_count'],
-                    'start_sentence': chunk['start_sentence'],
-                    'end_sentence': chunk['end_sentence'],
-                    'embedding': embedding
-                })
-                
-                progress = (i + 1) / len(chunks)
-                progress_bar.progress(progress)
-                status_text.text(f"Generating embeddings: {i+1}/{len(chunks)} chunks processed")
-                
+                for chunk in self.embed_batch([dict(chunk) for chunk in batch]):
+                    embeddings_data.append({
+                        'chunk_id': chunk['chunk_id'],
+                        'text': chunk['text'],
+                        'token_count': chunk['token_count'],
+                        'start_sentence': chunk['start_sentence'],
+                        'end_sentence': chunk['end_sentence'],
+                        'embedding': chunk['embedding']
+                    })
+            
             except Exception as e:
-                st.error(f"Error generating embedding for chunk {i}: {str(e)}")
-                continue
+                st.error(f"Error generating embeddings for chunks "
+                         f"{batch[0]['chunk_id']}-{batch[-1]['chunk_id']}: {str(e)}")
+            
+            processed += len(batch)
+            progress_bar.progress(processed / len(chunks))
+            status_text.text(f"Generating embeddings: {processed}/{len(chunks)} chunks processed")
         
         progress_bar.empty()
         status_text.empty()
         
         return pd.DataFrame(embeddings_data)
     
-    def find_similar_chunks(self, query: str, embeddings_df: pd.DataFrame, 
-                          top_k: int = 5, include_neighbors: bool = True) -> List[Dict]:
+    def find_similar_chunks(self, query: str, embeddings_df: Union[pd.DataFrame, RetrievalIndex], 
+                          top_k: int = 5, include_neighbors: bool = True,
+                          neighbor_window: int = None, min_similarity: float = None) -> List[Dict]:
         """
         Find chunks most similar to a query using cosine similarity.
         
@@ -190,9 +387,14 @@ class DocumentEmbedder:
         
         Args:
             query: User's question or search query
-            embeddings_df: DataFrame with chunk embeddings
+            embeddings_df: RetrievalIndex for the document, or a DataFrame
+                with chunk embeddings (indexed on the fly)
             top_k: Number of most similar chunks to retrieve
-            include_neighbors: Whether to include adjacent chunks (±1)
+            include_neighbors: Whether to include adjacent chunks
+            neighbor_window: Chunks to include on each side of a hit
+                (default: config.NEIGHBOR_WINDOW)
+            min_similarity: Drop hits scoring below this before neighbor
+                expansion (default: config.MIN_SIMILARITY, None for no floor)
         
         Returns:
             List of dictionaries containing:
@@ -205,47 +407,92 @@ class DocumentEmbedder:
         Note:
             Including neighbors helps maintain document flow and context,
             especially important for legislative texts where provisions
-            may span multiple chunks.
+            may span multiple chunks. Pass a cached RetrievalIndex for
+            repeated queries to avoid rebuilding the matrix each time; its
+            vector index backend (exact or IVF) selects the top hits.
         """
         try:
+            index = embeddings_df if isinstance(embeddings_df, RetrievalIndex) \
+                else RetrievalIndex.from_dataframe(embeddings_df)
+            
             query_response = self.client.embeddings.create(
                 model=config.EMBEDDING_MODEL,
                 input=query
             )
-            query_embedding = np.array(query_response.data[0].embedding).reshape(1, -1)
             
-            chunk_embeddings = np.vstack(embeddings_df['embedding'].values)
+            query_embedding = index.normalize_query(query_response.data[0].embedding)
             
-            similarities = cosine_similarity(query_embedding, chunk_embeddings)[0]
-            
-            top_indices = np.argsort(similarities)[::-1][:top_k]
-            
-            selected_chunks = set(top_indices)
+            if min_similarity is None:
+                min_similarity = config.MIN_SIMILARITY
+            top_indices = index.search(query_embedding, top_k, min_similarity)
             
             if include_neighbors:
-                for idx in top_indices:
-                    chunk_id = embeddings_df.iloc[idx]['chunk_id']
-                    
-                    neighbor_before = embeddings_df[embeddings_df['chunk_id'] == chunk_id - 1]
-                    neighbor_after = embeddings_df[embeddings_df['chunk_id'] == chunk_id + 1]
-                    
-                    if not neighbor_before.empty:
-                        selected_chunks.add(neighbor_before.index[0])
-                    if not neighbor_after.empty:
-                        selected_chunks.add(neighbor_after.index[0])
+                window = config.NEIGHBOR_WINDOW if neighbor_window is None else neighbor_window
+                selected = index.expand_neighbors(top_indices, window)
+            else:
+                selected = top_indices
             
-            results = []
-            for idx in sorted(selected_chunks):
-                row = embeddings_df.iloc[idx]
-                results.append({
-                    'chunk_id': row['chunk_id'],
-                    'text': row['text'],
-                    'similarity': similarities[idx],
-                    'token_count': row['token_count']
-                })
+            similarities = index.matrix[selected] @ query_embedding
             
-            return sorted(results, key=lambda x: x['similarity'], reverse=True)
+            # Assemble results from column arrays, best match first
+            order = np.argsort(-similarities, kind='stable')
+            selected = selected[order]
+            similarities = similarities[order]
             
+            return [
+                {
+                    'chunk_id': chunk_id,
+                    'text': text,
+                    'similarity': similarity,
+                    'token_count': token_count
+                }
+                for chunk_id, text, similarity, token_count in zip(
+                    index.chunk_ids[selected].tolist(),
+                    index.get_texts(selected),
+                    similarities.tolist(),
+                    index.token_counts[selected].tolist()
+                )
+            ]
+        
         except Exception as e:
             st.error(f"Error finding similar chunks: {str(e)}")
+            return []
+    
+    def search_corpus(self, query: str, corpus_index: CorpusIndex, top_k: int = 5,
+                      include_neighbors: bool = True, neighbor_window: int = None,
+                      min_similarity: float = None, document_ids: List[int] = None) -> List[Dict]:
+        """
+        Find chunks most similar to a query across many documents.
+        
+        Args:
+            query: User's question or search query
+            corpus_index: CorpusIndex over the documents to search
+            top_k: Number of most similar chunks to retrieve overall
+            include_neighbors: Whether to include adjacent chunks
+            neighbor_window: Chunks to include on each side of a hit
+                (default: config.NEIGHBOR_WINDOW)
+            min_similarity: Similarity floor (default: config.MIN_SIMILARITY)
+            document_ids: Restrict the search to these documents (default: all)
+        
+        Returns:
+            List of dictionaries as from find_similar_chunks(), each also
+            tagged with its document_id
+        """
+        try:
+            query_response = self.client.embeddings.create(
+                model=config.EMBEDDING_MODEL,
+                input=query
+            )
+            
+            return corpus_index.search(
+                query_response.data[0].embedding,
+                top_k=top_k,
+                include_neighbors=include_neighbors,
+                neighbor_window=config.NEIGHBOR_WINDOW if neighbor_window is None else neighbor_window,
+                min_similarity=config.MIN_SIMILARITY if min_similarity is None else min_similarity,
+                document_ids=document_ids
+            )
+        
+        except Exception as e:
+            st.error(f"Error searching corpus: {str(e)}")
             return []
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Embedding Dispatcher Module
+
+Keeps several embedding requests in flight while staying inside the
+OpenAI rate limits. A single dispatcher is shared by every background
+worker, so the request and token budgets apply to the process as a whole
+rather than to each worker separately.
+
+Key Features:
+- Thread pool holding up to N embedding requests in flight
+- Token-bucket limits for both requests-per-minute and tokens-per-minute
+- Adaptive backoff on HTTP 429: the shared rate is cut and slowly recovered
+- Automatic retries for rate-limited batches
+
+Typical usage:
+    dispatcher = EmbeddingDispatcher(embedder)
+    embedded, failed = dispatcher.embed_chunks(chunks, progress_callback)
+    dispatcher.shutdown()
+"""
+
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Tuple
+from openai import RateLimitError
+import config
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at a per-minute rate.
+    
+    The bucket holds at most one minute's worth of budget, so a burst can
+    never exceed the configured per-minute limit.
+    """
+    def __init__(self, rate_per_minute: float):
+        """
+        Initialize a full bucket.
+        
+        Args:
+            rate_per_minute: Budget replenished every minute
+        """
+        self.max_rate = float(rate_per_minute)
+        self.rate = float(rate_per_minute)
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate / 60.0)
+        self.updated_at = now
+    
+    def acquire(self, amount: float = 1):
+        """
+        Block until the requested budget is available, then consume it.
+        
+        Args:
+            amount: Budget to consume (clamped to the bucket capacity)
+        """
+        amount = min(float(amount), self.capacity)
+        
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * 60.0 / self.rate
+            time.sleep(min(wait, 1.0))
+    
+    def scale_rate(self, factor: float, floor: float = 0.05):
+        """
+        Multiply the refill rate, keeping it between floor * max and max.
+        
+        Args:
+            factor: Multiplier applied to the current rate
+            floor: Lowest allowed fraction of the configured rate
+        """
+        with self.lock:
+            self._refill()
+            self.rate = max(self.max_rate * floor, min(self.max_rate, self.rate * factor))
+
+class EmbeddingDispatcher:
+    """
+    Dispatches embedding batches concurrently under shared rate limits.
+    
+    Batches are formed by DocumentEmbedder.batch_chunks() and sent through
+    DocumentEmbedder.embed_batch() from a bounded thread pool.
+    """
+    def __init__(self, embedder, max_in_flight: int = None,
+                 tokens_per_minute: int = None, requests_per_minute: int = None):
+        """
+        Initialize the dispatcher.
+        
+        Args:
+            embedder: DocumentEmbedder used to batch and embed chunks
+            max_in_flight: Concurrent requests (default: config.EMBEDDING_MAX_IN_FLIGHT)
+            tokens_per_minute: Token budget (default: config.EMBEDDING_TOKENS_PER_MINUTE)
+            requests_per_minute: Request budget (default: config.EMBEDDING_REQUESTS_PER_MINUTE)
+        """
+        self.embedder = embedder
+        self.max_in_flight = max_in_flight or config.EMBEDDING_MAX_IN_FLIGHT
+        self.token_bucket = TokenBucket(tokens_per_minute or config.EMBEDDING_TOKENS_PER_MINUTE)
+        self.request_bucket = TokenBucket(requests_per_minute or config.EMBEDDING_REQUESTS_PER_MINUTE)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                           thread_name_prefix="EmbedRequest")
+        
+        # Shared backoff state: every in-flight request waits out a 429
+        self.lock = threading.Lock()
+        self.pause_until = 0.0
+        self.backoff = 1.0
+        self.rate_limited_count = 0
+    
+    def _wait_for_backoff(self):
+        while True:
+            with self.lock:
+                delay = self.pause_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 1.0))
+    
+    def _on_rate_limited(self, error: RateLimitError):
+        retry_after = None
+        try:
+            retry_after = float(error.response.headers.get('retry-after'))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        
+        with self.lock:
+            delay = retry_after if retry_after is not None else self.backoff
+            self.pause_until = max(self.pause_until, time.monotonic() + delay)
+            self.backoff = min(self.backoff * 2, 60.0)
+            self.rate_limited_count += 1
+        
+        # Halve the shared rate; _on_success() recovers it gradually
+        self.token_bucket.scale_rate(0.5)
+        self.request_bucket.scale_rate(0.5)
+        logger.warning(f"Embedding rate limited, pausing {delay:.1f}s")
+    
+    def _on_success(self):
+        with self.lock:
+            self.backoff = max(1.0, self.backoff / 2)
+        self.token_bucket.scale_rate(1.1)
+        self.request_bucket.scale_rate(1.1)
+    
+    def _embed_with_limits(self, batch: List[Dict]) -> List[Dict]:
+        batch_tokens = sum(chunk.get('token_count', 0) for chunk in batch)
+        
+        for attempt in range(config.EMBEDDING_MAX_RETRIES + 1):
+            self._wait_for_backoff()
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(batch_tokens)
+            
+            try:
+                result = self.embedder.embed_batch(batch)
+            except RateLimitError as e:
+                if attempt == config.EMBEDDING_MAX_RETRIES:
+                    raise
+                self._on_rate_limited(e)
+                continue
+            
+            self._on_success()
+            return result
+    
+    def submit(self, batch: List[Dict]):
+        """
+        Schedule one batch for embedding.
+        
+        Args:
+            batch: Chunk batch from DocumentEmbedder.batch_chunks()
+        
+        Returns:
+            concurrent.futures.Future resolving to the embedded chunks
+        """
+        return self.executor.submit(self._embed_with_limits, batch)
+    
+    def embed_chunks(self, chunks: List[Dict],
+                     progress_callback: Callable = None) -> Tuple[List[Dict], List[List[Dict]]]:
+        """
+        Embed all chunks of a document using concurrent batched requests.
+        
+        Args:
+            chunks: List of chunk dictionaries from chunk_text()
+            progress_callback: Optional function called with (processed, total)
+                after each batch completes
+        
+        Returns:
+            Tuple of (embedded chunks in document order, batches that failed)
+        """
+        futures = {self.submit(batch): batch for batch in self.embedder.batch_chunks(chunks)}
+        
+        embedded = []
+        failed = []
+        processed = 0
+        
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                embedded.extend(future.result())
+            except Exception as e:
+                logger.error(f"Error generating embeddings for chunks "
+                             f"{batch[0]['chunk_id']}-{batch[-1]['chunk_id']}: {e}")
+                failed.append(batch)
+            
+            processed += len(batch)
+            if progress_callback:
+                progress_callback(processed, len(chunks))
+        
+        embedded.sort(key=lambda chunk: chunk['chunk_id'])
+        return embedded, failed
+    
+    def get_stats(self) -> Dict:
+        """
+        Get dispatcher statistics.
+        
+        Returns:
+            Dict with the current effective rates and 429 count
+        """
+        return {
+            'embedding_tokens_per_minute': int(self.token_bucket.rate),
+            'embedding_requests_per_minute': int(self.request_bucket.rate),
+            'embedding_rate_limited': self.rate_limited_count
+        }
+    
+    def shutdown(self):
+        """Stop accepting work and wait for in-flight requests to finish."""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,516 @@
+"""
+Job Queue Module
+
+Durable, SQLite-backed queue of document processing jobs. Jobs live in the
+same database file as the documents, so queued work survives restarts and
+several processes (on one host, or on several hosts sharing the volume)
+can drain the same backlog.
+
+Key Features:
+- Atomic claims: a single UPDATE hands each job to exactly one worker
+- Leases with heartbeats; jobs whose lease expires are reclaimed
+- Attempt counting, so jobs that keep crashing workers can be abandoned
+- Orphaned leases from dead local processes are released on startup
+- In-process wakeup so local workers start new jobs without polling delay
+- Priority classes and small-document-first ordering, with aging
+- One live job per document: duplicate requests coalesce into the existing job
+- Finished jobs are pruned after config.JOB_RETENTION_SECONDS
+
+Scheduling:
+Each job gets a sort key when queued: its enqueue time, plus the delay of its
+priority class (config.JOB_PRIORITIES), plus config.JOB_SECONDS_PER_PAGE for
+each page. Workers claim the lowest key first, so interactive uploads and
+small documents jump ahead of bulk backlogs and large documents. Because the
+key is fixed at enqueue time, newer jobs stop overtaking a waiting job once
+its key is in the past; large bulk documents are delayed, never starved.
+
+Job states:
+- queued: waiting to be claimed
+- leased: claimed by a worker whose lease has not expired
+- done: processed (successfully or with the document marked failed)
+- failed: abandoned after too many attempts
+
+Typical usage:
+    jobs = JobQueue(db)
+    jobs.put({'document_id': doc_id, 'file_path': path}, priority='bulk', size=num_pages)
+    
+    job = jobs.claim(worker_id, timeout=1)
+    if job:
+        with jobs.keep_alive(job):
+            process(job)
+        jobs.complete(job)
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from .database import DocumentDatabase
+import config
+
+logger = logging.getLogger(__name__)
+
+# Distinguishes this process from an earlier one that reused its PID
+_INSTANCE = uuid.uuid4().hex[:8]
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobQueue:
+    """
+    Persistent job queue with lease/heartbeat semantics.
+    
+    Claimed jobs carry '_job_id' and '_lease_token' keys alongside their
+    payload; pass the job dict back to heartbeat(), complete() and release().
+    """
+    def __init__(self, db: DocumentDatabase, lease_seconds: float = None, max_attempts: int = None):
+        """
+        Initialize the queue, creating its table if needed.
+        
+        Args:
+            db: Database whose file holds the job table
+            lease_seconds: Lease length before a silent job is reclaimed
+                (default: config.JOB_LEASE_SECONDS)
+            max_attempts: Claims allowed per job (default: config.JOB_MAX_ATTEMPTS)
+        """
+        self.db = db
+        self.lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        self.max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+        self.wakeup = threading.Condition()
+        self.pruned_at = 0.0
+        self.init_table()
+        self.prune()
+    
+    def init_table(self):
+        """Create the jobs table and its indexes if they don't exist."""
+        with self.db.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_id INTEGER,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_token TEXT,
+                    lease_expires_at REAL,
+                    priority TEXT,
+                    sort_key REAL,
+                    enqueued_at REAL NOT NULL,
+                    finished_at REAL,
+                    last_error TEXT
+                )
+            """)
+            
+            # Queues created before priority scheduling
+            job_columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'priority' not in job_columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN priority TEXT")
+            if 'sort_key' not in job_columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN sort_key REAL")
+            
+            # Their jobs keep FIFO order and the bulk class
+            conn.execute("UPDATE jobs SET sort_key = enqueued_at WHERE sort_key IS NULL")
+            conn.execute("UPDATE jobs SET priority = 'bulk' WHERE priority IS NULL")
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, lease_expires_at);
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_schedule ON jobs(status, sort_key);
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_priority_schedule ON jobs(status, priority, sort_key);
+            """)
+            
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_jobs_document ON jobs(document_id);
+            """)
+    
+    @staticmethod
+    def worker_id(name: str) -> str:
+        """
+        Build a lease owner ID for a worker in this process.
+        
+        Args:
+            name: Worker name, unique within the process
+        
+        Returns:
+            str: "host:pid:instance:name"
+        """
+        return f"{socket.gethostname()}:{os.getpid()}:{_INSTANCE}:{name}"
+    
+    def put(self, job: Dict, priority: str = 'bulk', size: int = 0) -> int:
+        """
+        Add a job to the queue.
+        
+        If the job's document already has a queued or leased job, no new job
+        is added: the existing one is returned instead, moved up to this
+        request's priority and size-based place in line if that is sooner.
+        The check and insert are one statement, so concurrent requests from
+        any number of processes still produce a single job.
+        
+        Args:
+            job: JSON-serializable payload; 'document_id' is indexed
+            priority: Priority class, a key of config.JOB_PRIORITIES
+            size: Job size in pages (smaller jobs are scheduled sooner)
+        
+        Returns:
+            int: Job ID (of the existing job if coalesced)
+        
+        Raises:
+            ValueError: If priority is not a known class
+        """
+        if priority not in config.JOB_PRIORITIES:
+            raise ValueError(f"Unknown job priority: {priority} "
+                             f"(expected one of {', '.join(config.JOB_PRIORITIES)})")
+        
+        now = time.time()
+        sort_key = now + config.JOB_PRIORITIES[priority] + (size or 0) * config.JOB_SECONDS_PER_PAGE
+        
+        doc_id = job.get('document_id')
+        with self.db.connection() as conn:
+            cursor = conn.execute("""
+                INSERT INTO jobs (document_id, payload, priority, sort_key, enqueued_at)
+                SELECT ?, ?, ?, ?, ?
+                WHERE ? IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM jobs WHERE document_id = ? AND status IN ('queued', 'leased')
+                )
+            """, (doc_id, json.dumps(job), priority, sort_key, now, doc_id, doc_id))
+            
+            if cursor.rowcount:
+                job_id = cursor.lastrowid
+            else:
+                conn.execute("""
+                    UPDATE jobs SET priority = ?, sort_key = ?
+                    WHERE document_id = ? AND status = 'queued' AND sort_key > ?
+                """, (priority, sort_key, doc_id, sort_key))
+                job_id = conn.execute("""
+                    SELECT id FROM jobs WHERE document_id = ? AND status IN ('queued', 'leased')
+                    ORDER BY id LIMIT 1
+                """, (doc_id,)).fetchone()[0]
+                logger.info(f"Document {doc_id} already has job {job_id}; coalesced")
+                return job_id
+        
+        with self.wakeup:
+            self.wakeup.notify()
+        return job_id
+    
+    def claim(self, worker_id: str, timeout: float = None,
+              priorities: List[str] = None) -> Optional[Dict]:
+        """
+        Atomically lease the available job with the lowest sort key.
+        
+        Queued jobs and leased jobs whose lease has expired are both
+        available. Each claim counts as an attempt; callers should check
+        '_attempts' against max_attempts and fail() jobs that keep crashing
+        their workers.
+        
+        Args:
+            worker_id: Identifies the claiming worker (stored as lease owner)
+            timeout: Seconds to wait for a job (None returns immediately)
+            priorities: Only claim jobs of these priority classes (default: any)
+        
+        Returns:
+            Job payload with '_job_id', '_lease_token', '_attempts',
+            '_priority' and '_sort_key' keys, or None if no job became available
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            job = self._try_claim(worker_id, priorities)
+            if job is not None or timeout is None:
+                return job
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            
+            # Local put() calls wake us early; other processes are polled
+            with self.wakeup:
+                self.wakeup.wait(min(remaining, config.JOB_POLL_INTERVAL))
+    
+    def _try_claim(self, worker_id: str, priorities: List[str] = None) -> Optional[Dict]:
+        now = time.time()
+        token = uuid.uuid4().hex
+        
+        priority_filter = ''
+        if priorities:
+            priority_filter = f"AND priority IN ({', '.join('?' * len(priorities))})"
+        
+        # The first queued job (an index range scan on idx_jobs_schedule or
+        # idx_jobs_priority_schedule) competes with the first expired lease
+        with self.db.connection() as conn:
+            claimed = conn.execute("""
+                UPDATE jobs
+                SET status = 'leased', attempts = attempts + 1, lease_owner = ?,
+                    lease_token = ?, lease_expires_at = ?
+                WHERE id = (
+                    SELECT id FROM (
+                        SELECT * FROM (
+                            SELECT id, sort_key FROM jobs
+                            WHERE status = 'queued' {priority_filter}
+                            ORDER BY sort_key, id LIMIT 1
+                        )
+                        UNION ALL
+                        SELECT * FROM (
+                            SELECT id, sort_key FROM jobs
+                            WHERE status = 'leased' AND lease_expires_at < ? {priority_filter}
+                            ORDER BY sort_key, id LIMIT 1
+                        )
+                    )
+                    ORDER BY sort_key, id
+                    LIMIT 1
+                )
+            """.format(priority_filter=priority_filter),
+                (worker_id, token, now + self.lease_seconds, *(priorities or []),
+                 now, *(priorities or []))).rowcount
+            
+            if not claimed:
+                return None
+            
+            job_id, payload, attempts, priority, sort_key = conn.execute("""
+                SELECT id, payload, attempts, priority, sort_key
+                FROM jobs WHERE lease_token = ?
+            """, (token,)).fetchone()
+        
+        job = json.loads(payload)
+        job.update({'_job_id': job_id, '_lease_token': token, '_attempts': attempts,
+                    '_priority': priority, '_sort_key': sort_key})
+        if attempts > 1:
+            logger.info(f"Reclaimed job {job_id} (attempt {attempts})")
+        return job
+    
+    def heartbeat(self, job: Dict) -> bool:
+        """
+        Extend a claimed job's lease.
+        
+        Args:
+            job: Job returned by claim()
+        
+        Returns:
+            bool: False if the lease was lost (expired and reclaimed)
+        """
+        with self.db.connection() as conn:
+            return conn.execute("""
+                UPDATE jobs SET lease_expires_at = ?
+                WHERE id = ? AND lease_token = ? AND status = 'leased'
+            """, (time.time() + self.lease_seconds, job['_job_id'], job['_lease_token'])).rowcount > 0
+    
+    @contextmanager
+    def keep_alive(self, job: Dict) -> Iterator[None]:
+        """
+        Heartbeat a job from a background thread while the block runs.
+        
+        Args:
+            job: Job returned by claim()
+        """
+        stopped = threading.Event()
+        
+        def beat():
+            while not stopped.wait(self.lease_seconds / 3):
+                try:
+                    if not self.heartbeat(job):
+                        logger.warning(f"Lost lease on job {job['_job_id']}")
+                        return
+                except Exception as e:
+                    logger.error(f"Heartbeat error for job {job['_job_id']}: {e}")
+        
+        thread = threading.Thread(target=beat, name=f"Heartbeat-{job['_job_id']}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+    
+    def complete(self, job: Dict, error: str = None):
+        """
+        Mark a claimed job as finished.
+        
+        Also prunes old finished jobs, at most once per
+        config.JOB_PRUNE_INTERVAL.
+        
+        Args:
+            job: Job returned by claim()
+            error: Optional error recorded on the job
+        """
+        with self.db.connection() as conn:
+            conn.execute("""
+                UPDATE jobs SET status = 'done', finished_at = ?, last_error = ?,
+                       lease_token = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_token = ?
+            """, (time.time(), error, job['_job_id'], job['_lease_token']))
+        
+        if time.time() - self.pruned_at >= config.JOB_PRUNE_INTERVAL:
+            self.prune()
+    
+    def prune(self, retention_seconds: float = None) -> int:
+        """
+        Delete done and failed jobs that finished more than retention_seconds ago.
+        
+        Args:
+            retention_seconds: Age after which finished jobs are deleted
+                (default: config.JOB_RETENTION_SECONDS)
+        
+        Returns:
+            int: Number of jobs deleted
+        """
+        retention_seconds = config.JOB_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+        self.pruned_at = time.time()
+        with self.db.connection() as conn:
+            pruned = conn.execute("""
+                DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?
+            """, (self.pruned_at - retention_seconds,)).rowcount
+        
+        if pruned:
+            logger.info(f"Pruned {pruned} finished jobs")
+        return pruned
+    
+    def release(self, job: Dict, error: str = None, count_attempt: bool = True):
+        """
+        Return a claimed job to the queue for another attempt.
+        
+        Jobs that have used up their attempts are marked failed instead.
+        
+        Args:
+            job: Job returned by claim()
+            error: Optional error recorded on the job
+            count_attempt: Whether the attempt counts towards max_attempts
+                (False for jobs interrupted by a shutdown rather than failing)
+        """
+        attempts = 0 if count_attempt else 1  # attempts to give back
+        with self.db.connection() as conn:
+            conn.execute("""
+                UPDATE jobs
+                SET status = CASE WHEN attempts - ? >= ? THEN 'failed' ELSE 'queued' END,
+                    finished_at = CASE WHEN attempts - ? >= ? THEN ? END,
+                    attempts = attempts - ?,
+                    last_error = ?, lease_token = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_token = ?
+            """, (attempts, self.max_attempts, attempts, self.max_attempts, time.time(), attempts,
+                  error, job['_job_id'], job['_lease_token']))
+        
+        with self.wakeup:
+            self.wakeup.notify()
+    
+    def fail(self, job: Dict, error: str):
+        """
+        Abandon a claimed job without further attempts.
+        
+        Args:
+            job: Job returned by claim()
+            error: Reason recorded on the job
+        """
+        with self.db.connection() as conn:
+            conn.execute("""
+                UPDATE jobs SET status = 'failed', finished_at = ?, last_error = ?,
+                       lease_token = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_token = ?
+            """, (time.time(), error, job['_job_id'], job['_lease_token']))
+    
+    def cancel_document(self, doc_id: int) -> int:
+        """
+        Drop a document's queued jobs (e.g. when the document is deleted).
+        
+        Leased jobs are left to their workers.
+        
+        Args:
+            doc_id: Document ID
+        
+        Returns:
+            int: Number of jobs cancelled
+        """
+        with self.db.connection() as conn:
+            return conn.execute("""
+                DELETE FROM jobs WHERE document_id = ? AND status = 'queued'
+            """, (doc_id,)).rowcount
+    
+    def release_orphans(self) -> int:
+        """
+        Expire leases held by processes on this host that have exited.
+        
+        Without this, jobs interrupted by a restart would wait out their
+        full lease before being reclaimed. Leases held by other hosts are
+        left to expire normally.
+        
+        Returns:
+            int: Number of leases expired
+        """
+        host = socket.gethostname()
+        with self.db.connection() as conn:
+            leases = conn.execute("""
+                SELECT id, lease_owner FROM jobs WHERE status = 'leased'
+            """).fetchall()
+            
+            orphaned = []
+            for job_id, owner in leases:
+                owner_host, pid, instance = (owner or '::').split(':')[:3]
+                if owner_host != host or not pid.isdigit():
+                    continue
+                if instance != _INSTANCE and (int(pid) == os.getpid() or not _pid_alive(int(pid))):
+                    orphaned.append((job_id,))
+            
+            conn.executemany("""
+                UPDATE jobs SET lease_expires_at = 0 WHERE id = ? AND status = 'leased'
+            """, orphaned)
+        
+        if orphaned:
+            logger.info(f"Released {len(orphaned)} jobs leased by exited processes")
+        return len(orphaned)
+    
+    def active_document_ids(self) -> List[int]:
+        """
+        Documents with a queued or leased job.
+        
+        Returns:
+            List of document IDs
+        """
+        with self.db.connection() as conn:
+            rows = conn.execute("""
+                SELECT DISTINCT document_id FROM jobs
+                WHERE status IN ('queued', 'leased') AND document_id IS NOT NULL
+            """).fetchall()
+        return [row[0] for row in rows]
+    
+    def size(self) -> int:
+        """
+        Number of jobs waiting to be claimed.
+        
+        Returns:
+            int: Queued jobs plus leased jobs whose lease has expired
+        """
+        with self.db.connection() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM jobs
+                WHERE status = 'queued' OR (status = 'leased' AND lease_expires_at < ?)
+            """, (time.time(),)).fetchone()[0]
+    
+    def get_stats(self) -> Dict:
+        """
+        Get job counts by state.
+        
+        Returns:
+            Dict with jobs_{status} counts and jobs_queued_{priority} counts
+        """
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            queued = conn.execute("""
+                SELECT priority, COUNT(*) FROM jobs
+                WHERE status = 'queued' GROUP BY priority
+            """).fetchall()
+        stats = {f"jobs_{status}": count for status, count in rows}
+        stats.update({f"jobs_queued_{priority}": count for priority, count in queued})
+        return stats
@@ -10,17 +10,53 @@ The PDFLoader class handles:
 - Metadata extraction for document information
 - Error handling for corrupted or protected PDFs
 - Page-by-page processing for memory efficiency
+- Parallel extraction of large documents across a process pool
 
 Typical usage:
     loader = PDFLoader()
     with open('document.pdf', 'rb') as f:
         text = loader.load_pdf(f)
         info = loader.get_document_info(f)
+    
+    # Or incrementally:
+    with open('document.pdf', 'rb') as f:
+        for page_number, page_text in loader.iter_pages(f):
+            ...
 """
 
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import PyPDF2
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
 import streamlit as st
+import config
+
+# Separator inserted before each page's text in the extracted document
+PAGE_MARKER = "\n--- Page {} ---\n"
+
+# Identifies the extraction logic in the extracted-text cache; bump the
+# suffix whenever extraction output changes for the same PyPDF2 version
+EXTRACTOR_VERSION = f"pypdf2-{PyPDF2.__version__}-1"
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """
+    Extract the text of pages [start, end) of a PDF.
+    
+    Runs in a worker process; each worker opens and parses the file itself,
+    so only the path and page numbers cross the process boundary.
+    
+    Args:
+        path: Path to the PDF file
+        start: First page index (0-based, inclusive)
+        end: Last page index (exclusive)
+    
+    Returns:
+        List of page texts in page order
+    """
+    pdf_reader = PyPDF2.PdfReader(path)
+    return [pdf_reader.pages[page_num].extract_text() for page_num in range(start, end)]
 
 class PDFLoader:
     """
@@ -30,11 +66,103 @@ class PDFLoader:
     with special handling for large government documents and legislative texts.
     """
     
-    def __init__(self):
-        """Initialize the PDFLoader with default settings."""
-        pass
+    def __init__(self, max_workers: int = None):
+        """
+        Initialize the PDFLoader.
+        
+        Args:
+            max_workers: Processes used for parallel extraction
+                (default: config.PDF_EXTRACT_WORKERS, or the CPU count)
+        """
+        self.max_workers = max_workers or config.PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.executor_lock = threading.Lock()
     
-    def load_pdf(self, pdf_file) -> str:
+    def _source_path(self, pdf_file) -> Optional[str]:
+        # Worker processes reopen the file, so it must exist on disk
+        path = getattr(pdf_file, 'name', None)
+        return path if isinstance(path, str) and os.path.isfile(path) else None
+    
+    def _extract_parallel(self, path: str, num_pages: int) -> Iterator[str]:
+        """
+        Extract all pages of a PDF across the process pool.
+        
+        The page range is split into contiguous slices (two per worker, to
+        even out slow pages) and the results are reassembled in page order.
+        
+        Args:
+            path: Path to the PDF file
+            num_pages: Total number of pages
+        
+        Yields:
+            Page texts in page order
+        """
+        # Worker threads share one loader; create the pool exactly once
+        with self.executor_lock:
+            if self.executor is None:
+                # Forking this (multi-threaded) process could copy a lock held
+                # by another thread, e.g. logging's, into a child that then
+                # deadlocks; start children from a clean server process instead
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            executor = self.executor
+        
+        slice_size = -(-num_pages // (self.max_workers * 2))
+        starts = list(range(0, num_pages, slice_size))
+        ends = [min(start + slice_size, num_pages) for start in starts]
+        
+        for texts in executor.map(_extract_page_range, [path] * len(starts), starts, ends):
+            yield from texts
+    
+    def close(self):
+        """Shut down the extraction process pool, if one was started."""
+        with self.executor_lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def iter_pages(self, pdf_file, parallel: bool = None) -> Iterator[Tuple[int, str]]:
+        """
+        Extract a PDF page by page.
+        
+        Pages are yielded as soon as they are extracted, so callers can
+        start chunking before the whole document has been read.
+        
+        Args:
+            pdf_file: File-like object containing the PDF data (opened in 'rb' mode)
+            parallel: Extract pages across a process pool (default:
+                config.PDF_PARALLEL_EXTRACTION)
+        
+        Yields:
+            Tuple of (page_number, page_text), page numbers starting at 1
+        
+        Raises:
+            Exception: If the PDF cannot be parsed (unlike load_pdf(), errors
+                are not swallowed)
+        
+        Note:
+            Parallel extraction needs a file on disk and at least
+            config.PDF_PARALLEL_MIN_PAGES pages; otherwise pages are
+            extracted serially. Parallel slices are yielded in page order
+            as they complete.
+        """
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        num_pages = len(pdf_reader.pages)
+        path = self._source_path(pdf_file)
+        
+        if parallel is None:
+            parallel = config.PDF_PARALLEL_EXTRACTION
+        
+        if parallel and path and self.max_workers > 1 and num_pages >= config.PDF_PARALLEL_MIN_PAGES:
+            page_texts = self._extract_parallel(path, num_pages)
+        else:
+            page_texts = (page.extract_text() for page in pdf_reader.pages)
+        
+        for page_num, page_text in enumerate(page_texts):
+            yield page_num + 1, page_text
+    
+    def load_pdf(self, pdf_file, parallel: bool = None) -> str:
         """
         Extract text content from a PDF file.
         
@@ -43,6 +171,8 @@ class PDFLoader:
         
         Args:
             pdf_file: File-like object containing the PDF data (opened in 'rb' mode)
+            parallel: Extract pages across a process pool (default:
+                config.PDF_PARALLEL_EXTRACTION)
         
         Returns:
             str: Extracted text with page markers, or empty string on failure
@@ -51,17 +181,15 @@ class PDFLoader:
             - Page markers are inserted as "--- Page X ---" between pages
             - Handles encrypted PDFs gracefully by returning empty string
             - Preserves original formatting as much as PyPDF2 allows
+            - Use iter_pages() to process large documents incrementally
         """
         try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                text += f"\n--- Page {page_num + 1} ---\n"
-                text += page_text
+            parts = []
+            for page_number, page_text in self.iter_pages(pdf_file, parallel):
+                parts.append(PAGE_MARKER.format(page_number))
+                parts.append(page_text)
             
-            return text
+            return "".join(parts)
         
         except Exception as e:
             st.error(f"Error loading PDF: {str(e)}")
@@ -31,14 +31,18 @@ Typical usage:
     rag_answer = rag_chain.answer_question(query, embeddings_df)
     non_rag_answer = rag_chain.generate_non_rag_answer(query)
     hybrid_answer = rag_chain.generate_hybrid_answer(query, embeddings_df)
+    
+    # Across a library of documents:
+    corpus_answer = rag_chain.answer_corpus_question(query, processor.get_corpus_index())
 """
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union, Callable
 from openai import OpenAI
 import pandas as pd
 import streamlit as st
 import tiktoken
 from .embed_and_store import DocumentEmbedder
+from .retrieval_index import RetrievalIndex, CorpusIndex
 import config
 
 class RAGChain:
@@ -191,7 +195,7 @@ Please provide a comprehensive answer with citations to specific chunks (using c
         current_tokens = 0
         
         for chunk in chunks:
-            chunk_header = f"[Chunk {chunk['chunk_id']}] (Similarity: {chunk.get('similarity', 0):.3f})"
+            chunk_header = self._chunk_header(chunk)
             chunk_text = f"{chunk_header}\n{chunk['text']}\n\n"
             chunk_tokens = len(self.encoding.encode(chunk_text))
             
@@ -213,6 +217,21 @@ Please provide a comprehensive answer with citations to specific chunks (using c
         
         return limited_chunks
     
+    def _chunk_header(self, chunk: Dict) -> str:
+        """
+        Build the citation header for a chunk.
+        
+        Args:
+            chunk: Chunk dictionary (with document_id for corpus hits)
+        
+        Returns:
+            Header such as "[Chunk 12] (Similarity: 0.812)" or
+            "[Doc 3 Chunk 12] (Similarity: 0.812)"
+        """
+        source = f"Doc {chunk['document_id']} Chunk {chunk['chunk_id']}" if 'document_id' in chunk \
+            else f"Chunk {chunk['chunk_id']}"
+        return f"[{source}] (Similarity: {chunk.get('similarity', 0):.3f})"
+    
     def _build_context(self, chunks: List[Dict]) -> str:
         """
         Build formatted context string from chunks.
@@ -226,12 +245,12 @@ Please provide a comprehensive answer with citations to specific chunks (using c
         context_parts = []
         
         for chunk in chunks:
-            chunk_header = f"[Chunk {chunk['chunk_id']}] (Similarity: {chunk.get('similarity', 0):.3f})"
+            chunk_header = self._chunk_header(chunk)
             context_parts.append(f"{chunk_header}\n{chunk['text']}\n")
         
         return "\n".join(context_parts)
     
-    def answer_question(self, query: str, embeddings_df: pd.DataFrame, 
+    def answer_question(self, query: str, embeddings_df: Union[pd.DataFrame, RetrievalIndex], 
                        top_k: int = 5, include_neighbors: bool = True) -> Dict:
         """
         Complete RAG pipeline: retrieve chunks and generate answer.
@@ -241,7 +260,7 @@ Please provide a comprehensive answer with citations to specific chunks (using c
         
         Args:
             query: User's question
-            embeddings_df: DataFrame with document embeddings
+            embeddings_df: RetrievalIndex or DataFrame with document embeddings
             top_k: Number of chunks to retrieve
             include_neighbors: Whether to include adjacent chunks
         
@@ -263,6 +282,45 @@ Please provide a comprehensive answer with citations to specific chunks (using c
         
         return self.generate_answer(query, relevant_chunks)
     
+    def answer_corpus_question(self, query: str, corpus_index: CorpusIndex,
+                               document_ids: List[int] = None,
+                               doc_filter: Callable[[Dict], bool] = None,
+                               top_k: int = 5, include_neighbors: bool = True) -> Dict:
+        """
+        RAG-only answer retrieved from a set of documents instead of one.
+        
+        Args:
+            query: User's question
+            corpus_index: CorpusIndex over completed documents
+                (see BackgroundProcessor.get_corpus_index())
+            document_ids: Restrict retrieval to these documents (default: all)
+            doc_filter: Predicate on document metadata, e.g.
+                lambda doc: doc['filename'].startswith('HB')
+            top_k: Number of chunks to retrieve across the selected documents
+            include_neighbors: Whether to include adjacent chunks
+        
+        Returns:
+            Dict with answer and metadata (see generate_answer); citations
+            carry the document_id of each chunk
+        """
+        selected = corpus_index.select_documents(document_ids, doc_filter)
+        
+        relevant_chunks = self.embedder.search_corpus(
+            query, corpus_index, top_k=top_k, include_neighbors=include_neighbors,
+            document_ids=selected
+        )
+        
+        if not relevant_chunks:
+            return {
+                'answer': "I couldn't find relevant information in the selected documents to answer your question.",
+                'model_used': "N/A",
+                'chunks_used': 0,
+                'context_tokens': 0,
+                'citations': []
+            }
+        
+        return self.generate_answer(query, relevant_chunks)
+    
     def generate_non_rag_answer(self, query: str, model: str = "gpt-4") -> Dict:
         """
         Generate answer using only LLM knowledge (control group).
@@ -333,12 +391,12 @@ Please provide a comprehensive answer with citations to specific chunks (using c
                 'total_tokens': 0
             }
 
-    def get_document_summary(self, embeddings_df: pd.DataFrame, max_chunks: int = 10) -> str:
+    def get_document_summary(self, embeddings_df: Union[pd.DataFrame, RetrievalIndex], max_chunks: int = 10) -> str:
         """
         Generate a summary of the document's main topics.
         
         Args:
-            embeddings_df: DataFrame with document embeddings
+            embeddings_df: RetrievalIndex or DataFrame with document embeddings
             max_chunks: Maximum chunks to use for summary
         
         Returns:
@@ -377,7 +435,7 @@ Focus on the main topics, key provisions, and overall purpose of the document.""
         except Exception as e:
             return f"Error generating summary: {str(e)}"
     
-    def generate_hybrid_answer(self, query: str, embeddings_df: pd.DataFrame, 
+    def generate_hybrid_answer(self, query: str, embeddings_df: Union[pd.DataFrame, RetrievalIndex], 
                               top_k: int = 5, include_neighbors: bool = True, 
                               model: str = None) -> Dict:
         """
@@ -389,7 +447,7 @@ Focus on the main topics, key provisions, and overall purpose of the document.""
         
         Args:
             query: User's question
-            embeddings_df: DataFrame with document embeddings
+            embeddings_df: RetrievalIndex or DataFrame with document embeddings
             top_k: Number of chunks to retrieve
             include_neighbors: Whether to include adjacent chunks
             model: Optional model override
@@ -0,0 +1,556 @@
+"""
+Retrieval Index Module
+
+In-memory, query-ready representation of a processed document. Building
+the index once per document removes the per-query cost of stacking the
+embedding column and renormalizing every row.
+
+Key Features:
+- One contiguous, L2-normalized float32 matrix per document
+- Parallel chunk_id / token_count arrays aligned with matrix rows
+- Chunk text held in memory or fetched on demand for selected rows only
+- Cosine similarity as a single matrix-vector product
+- chunk_id -> row lookup array for O(k) neighbor expansion
+- Pluggable nearest-neighbor backend (exact or IVF, see vector_index)
+- LRU cache of indexes keyed by (document_id, version)
+- Corpus-level index over many documents, updated incrementally
+
+Typical usage:
+    cache = IndexCache()
+    index = cache.get_or_build(doc_id, version,
+                               lambda: RetrievalIndex.from_arrays(db.get_chunk_arrays(doc_id), version))
+    similarities = index.score(query_embedding)
+    
+    corpus = CorpusIndex()
+    corpus.add_document(doc_id, index, doc_metadata)
+    hits = corpus.search(query_embedding, top_k=10)
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from .vector_index import ExactIndex, SegmentedIVF, select_top_k
+import config
+
+logger = logging.getLogger(__name__)
+
+class RetrievalIndex:
+    """
+    Normalized embedding matrix and chunk metadata for one document.
+    
+    Row i of the matrix corresponds to element i of every metadata array.
+    """
+    def __init__(self, chunk_ids: np.ndarray, embeddings: np.ndarray,
+                 texts: Optional[np.ndarray], token_counts: np.ndarray, version: Hashable = None,
+                 text_loader: Callable[[List[int]], Dict[int, str]] = None):
+        """
+        Build the index from aligned arrays.
+        
+        Args:
+            chunk_ids: Chunk identifiers, one per row
+            embeddings: 2-D array of embedding vectors, one row per chunk
+            texts: Chunk texts, one per row, or None to load them on demand
+            token_counts: Token counts, one per row
+            version: Opaque version tag of the source document
+            text_loader: Maps chunk_ids to texts (e.g. DocumentDatabase.get_chunk_texts);
+                required when texts is None
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+        
+        # Unit-length rows (OpenAI embeddings are) are used as-is, so a
+        # memory-mapped matrix stays shared instead of being copied
+        if matrix.flags.c_contiguous and np.allclose(norms, 1.0, atol=1e-4):
+            self.matrix = matrix
+        else:
+            norms[norms == 0] = 1.0
+            self.matrix = matrix / norms[:, None]
+        self.chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        self.texts = np.asarray(texts, dtype=object) if texts is not None else None
+        self.text_loader = text_loader
+        self.token_counts = np.asarray(token_counts, dtype=np.int64)
+        self.version = version
+        
+        # row_of[chunk_id] is the matrix row of that chunk, or -1 if absent
+        size = int(self.chunk_ids.max()) + 1 if len(self.chunk_ids) else 0
+        self.row_of = np.full(size, -1, dtype=np.int64)
+        self.row_of[self.chunk_ids] = np.arange(len(self.chunk_ids))
+        
+        # Replaced by an approximate backend for large documents
+        self.vector_index = ExactIndex(self.matrix)
+    
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], version: Hashable = None,
+                    text_loader: Callable[[List[int]], Dict[int, str]] = None) -> 'RetrievalIndex':
+        """
+        Build an index from DocumentDatabase.get_chunk_arrays() output.
+        
+        Uses the loader's contiguous matrix directly, skipping any
+        per-row stacking.
+        
+        Args:
+            arrays: Dict with chunk_id, token_count, embedding and
+                has_embedding arrays, and optionally text
+            version: Opaque version tag of the source document
+            text_loader: Fetches texts on demand when arrays has no text column
+        
+        Returns:
+            RetrievalIndex over the chunks that have embeddings
+        """
+        keep = arrays['has_embedding']
+        if not keep.all():
+            arrays = {column: values[keep] for column, values in arrays.items()}
+        return cls(arrays['chunk_id'], arrays['embedding'], arrays.get('text'),
+                   arrays['token_count'], version, text_loader)
+    
+    @classmethod
+    def from_dataframe(cls, embeddings_df: pd.DataFrame, version: Hashable = None) -> 'RetrievalIndex':
+        """
+        Build an index from a get_chunks_df() / generate_embeddings() DataFrame.
+        
+        Args:
+            embeddings_df: DataFrame with chunk_id, text, token_count and embedding columns
+            version: Opaque version tag of the source document
+        
+        Returns:
+            RetrievalIndex (empty if the DataFrame has no embeddings)
+        """
+        if embeddings_df.empty or 'embedding' not in embeddings_df.columns:
+            return cls(np.empty(0), np.empty((0, 0)), np.empty(0), np.empty(0), version)
+        
+        embedded = embeddings_df[embeddings_df['embedding'].notna()]
+        return cls(
+            embedded['chunk_id'].to_numpy(),
+            np.vstack(embedded['embedding'].values),
+            embedded['text'].to_numpy(),
+            embedded['token_count'].to_numpy(),
+            version
+        )
+    
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+    
+    def normalize_query(self, query_embedding) -> np.ndarray:
+        """
+        Convert a query embedding to a normalized float32 vector.
+        
+        Args:
+            query_embedding: Query embedding vector
+        
+        Returns:
+            np.ndarray of unit length (unless the input is all zeros)
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+    
+    def search(self, query_embedding, top_k: int, min_similarity: float = None) -> np.ndarray:
+        """
+        Find the rows most similar to a query through the vector index backend.
+        
+        Args:
+            query_embedding: Query embedding vector
+            top_k: Number of rows to return
+            min_similarity: Optional similarity floor
+        
+        Returns:
+            np.ndarray of matrix rows, best first
+        """
+        return self.vector_index.search(self.normalize_query(query_embedding), top_k, min_similarity)
+    
+    def get_texts(self, rows: np.ndarray) -> List[str]:
+        """
+        Texts of the given rows, loading them on demand if not held in memory.
+        
+        Args:
+            rows: Matrix rows
+        
+        Returns:
+            List of chunk texts, aligned with rows
+        """
+        if self.texts is not None:
+            return self.texts[rows].tolist()
+        
+        chunk_ids = self.chunk_ids[rows].tolist()
+        texts = self.text_loader(chunk_ids) if chunk_ids else {}
+        return [texts.get(chunk_id, '') for chunk_id in chunk_ids]
+    
+    def score(self, query_embedding) -> np.ndarray:
+        """
+        Cosine similarity between a query vector and every chunk.
+        
+        Args:
+            query_embedding: Query embedding vector
+        
+        Returns:
+            np.ndarray of similarities, one per row
+        """
+        return self.matrix @ self.normalize_query(query_embedding)
+    
+    def expand_neighbors(self, rows: np.ndarray, window: int) -> np.ndarray:
+        """
+        Add the rows of chunks within ±window chunk_ids of the given rows.
+        
+        Args:
+            rows: Matrix rows of the selected chunks
+            window: Number of neighboring chunks to include on each side
+        
+        Returns:
+            np.ndarray of unique rows (sorted), including the input rows
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if window <= 0 or not len(rows):
+            return np.unique(rows)
+        
+        offsets = np.arange(-window, window + 1)
+        neighbor_ids = (self.chunk_ids[rows][:, None] + offsets[None, :]).ravel()
+        neighbor_ids = neighbor_ids[(neighbor_ids >= 0) & (neighbor_ids < len(self.row_of))]
+        neighbor_rows = self.row_of[neighbor_ids]
+        
+        return np.unique(np.concatenate((rows, neighbor_rows[neighbor_rows >= 0])))
+
+class IndexCache:
+    """
+    Thread-safe LRU cache of RetrievalIndex objects.
+    
+    Entries are keyed by document ID and validated against a version tag,
+    so a reprocessed document is rebuilt rather than served stale.
+    """
+    def __init__(self, max_entries: int = None):
+        """
+        Initialize an empty cache.
+        
+        Args:
+            max_entries: Indexes kept in memory (default: config.RETRIEVAL_INDEX_CACHE_SIZE)
+        """
+        self.max_entries = max_entries or config.RETRIEVAL_INDEX_CACHE_SIZE
+        self.entries: "OrderedDict[int, RetrievalIndex]" = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, doc_id: int, version: Hashable) -> Optional[RetrievalIndex]:
+        """
+        Return the cached index for a document if it matches `version`.
+        
+        Args:
+            doc_id: Document ID
+            version: Expected version tag
+        
+        Returns:
+            RetrievalIndex or None
+        """
+        with self.lock:
+            index = self.entries.get(doc_id)
+            if index is None or index.version != version:
+                return None
+            self.entries.move_to_end(doc_id)
+            return index
+    
+    def put(self, doc_id: int, index: RetrievalIndex):
+        """
+        Store an index, evicting the least recently used entry if full.
+        
+        Args:
+            doc_id: Document ID
+            index: Index to cache
+        """
+        with self.lock:
+            self.entries[doc_id] = index
+            self.entries.move_to_end(doc_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def get_or_build(self, doc_id: int, version: Hashable,
+                     builder: Callable[[], RetrievalIndex]) -> RetrievalIndex:
+        """
+        Return the cached index, building it with `builder()` on a miss.
+        
+        Args:
+            doc_id: Document ID
+            version: Current version tag of the document
+            builder: Returns a new RetrievalIndex for the document
+        
+        Returns:
+            RetrievalIndex for the document
+        """
+        index = self.get(doc_id, version)
+        if index is None:
+            index = builder()
+            self.put(doc_id, index)
+        return index
+    
+    def invalidate(self, doc_id: int):
+        """
+        Drop a document's index from the cache.
+        
+        Args:
+            doc_id: Document ID
+        """
+        with self.lock:
+            self.entries.pop(doc_id, None)
+
+class CorpusIndex:
+    """
+    Searchable index over the chunks of many documents.
+    
+    Each document contributes a RetrievalIndex segment, searched in place:
+    segments are never concatenated, so adding or removing a document is
+    cheap and memory-mapped matrices stay shared. Large corpora use a
+    SegmentedIVF that is updated incrementally and retrained on a
+    background thread only once enough rows have changed.
+    """
+    def __init__(self, vector_index_path: str = None):
+        """
+        Initialize an empty corpus.
+        
+        Args:
+            vector_index_path: Where to persist the corpus-wide IVF index
+                (None to rebuild it in memory only)
+        """
+        self.vector_index_path = vector_index_path
+        self.segments: Dict[int, RetrievalIndex] = {}
+        self.documents: Dict[int, Dict] = {}
+        self.n_rows = 0
+        self.lock = threading.Lock()
+        
+        # Approximate backend, built on the first search past config.IVF_MIN_VECTORS
+        self.vector_index: Optional[SegmentedIVF] = None
+        self.building = False
+        self.build_thread: Optional[threading.Thread] = None
+    
+    def __len__(self) -> int:
+        return self.n_rows
+    
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self.segments
+    
+    def add_document(self, doc_id: int, index: RetrievalIndex, metadata: Dict = None):
+        """
+        Add or replace a document's segment.
+        
+        Args:
+            doc_id: Document ID
+            index: The document's RetrievalIndex
+            metadata: Document row (filename, status, ...) used by filters
+        """
+        with self.lock:
+            previous = self.segments.get(doc_id)
+            self.n_rows += len(index) - (len(previous) if previous is not None else 0)
+            self.segments[doc_id] = index
+            self.documents[doc_id] = metadata or {'id': doc_id}
+            
+            if self.vector_index is not None:
+                if len(index) and index.matrix.shape[1] != self.vector_index.centroids.shape[1]:
+                    # Embedding dimension changed; retrain on the next search
+                    self.vector_index = None
+                else:
+                    self.vector_index.add_many([(doc_id, index.matrix, index.version)])
+    
+    def remove_document(self, doc_id: int):
+        """
+        Remove a document's segment if present.
+        
+        Args:
+            doc_id: Document ID
+        """
+        with self.lock:
+            segment = self.segments.pop(doc_id, None)
+            if segment is not None:
+                self.documents.pop(doc_id, None)
+                self.n_rows -= len(segment)
+                if self.vector_index is not None:
+                    self.vector_index.remove(doc_id)
+    
+    def get_segment(self, doc_id: int) -> Optional[RetrievalIndex]:
+        """
+        Get a document's segment.
+        
+        Args:
+            doc_id: Document ID
+        
+        Returns:
+            RetrievalIndex or None if the document is not in the corpus
+        """
+        return self.segments.get(doc_id)
+    
+    def select_documents(self, document_ids: Iterable[int] = None,
+                         doc_filter: Callable[[Dict], bool] = None) -> Optional[List[int]]:
+        """
+        Resolve a document set and/or metadata filter to document IDs.
+        
+        Args:
+            document_ids: Restrict to these documents
+            doc_filter: Predicate applied to each document's metadata
+        
+        Returns:
+            List of matching document IDs, or None for the whole corpus
+        """
+        if document_ids is None and doc_filter is None:
+            return None
+        
+        with self.lock:
+            candidates = list(self.documents) if document_ids is None \
+                else [doc_id for doc_id in document_ids if doc_id in self.documents]
+            if doc_filter is not None:
+                candidates = [doc_id for doc_id in candidates if doc_filter(self.documents[doc_id])]
+        
+        return candidates
+    
+    def save(self):
+        """Persist the corpus IVF index (centroids and assignments), if there is one."""
+        with self.lock:
+            if self.vector_index is not None and self.vector_index_path:
+                self.vector_index.save(self.vector_index_path)
+    
+    def _ivf_index(self) -> Optional[SegmentedIVF]:
+        """
+        Return the IVF index to search, starting a build or retrain if due.
+        
+        Training runs on a background thread on a snapshot of the segments;
+        until it finishes, searches keep using the previous index, or exact
+        search if there is none yet.
+        
+        Returns:
+            SegmentedIVF, or None to search exactly
+        """
+        with self.lock:
+            if config.VECTOR_INDEX_BACKEND == 'exact' or self.n_rows < config.IVF_MIN_VECTORS:
+                return None
+            if config.VECTOR_INDEX_BACKEND != 'ivf':
+                raise ValueError(f"Unknown vector index backend: {config.VECTOR_INDEX_BACKEND}")
+            
+            current = self.vector_index
+            if self.building or (current is not None and not current.needs_retrain()):
+                return current
+            self.building = True
+            snapshot = {doc_id: segment for doc_id, segment in self.segments.items() if len(segment)}
+            self.build_thread = threading.Thread(target=self._build_ivf, args=(current, snapshot),
+                                                 name="CorpusIVF", daemon=True)
+            self.build_thread.start()
+        
+        return current
+    
+    def _build_ivf(self, current: Optional[SegmentedIVF], snapshot: Dict[int, RetrievalIndex]):
+        """
+        Build or retrain the IVF index and swap it in.
+        
+        Documents added or removed during training are applied before the
+        swap.
+        
+        Args:
+            current: The index being replaced (None on first build)
+            snapshot: Segments to train on, by document ID
+        """
+        try:
+            segments = [(doc_id, segment.matrix, segment.version) for doc_id, segment in snapshot.items()]
+            
+            # On startup, reuse persisted centroids and assignments
+            index = None
+            if current is None and self.vector_index_path and segments:
+                index = SegmentedIVF.load(self.vector_index_path, segments[0][1].shape[1])
+                if index is not None:
+                    index.add_many(segments)
+                    index.saved = {}
+                    if index.needs_retrain():
+                        index = None
+            
+            if index is None:
+                index = SegmentedIVF.train(segments)
+                logger.info(f"Trained corpus IVF index: {len(index)} vectors, "
+                            f"{len(index.centroids)} lists, nprobe={index.nprobe}")
+        except Exception as e:
+            logger.error(f"Corpus IVF index build failed: {e}")
+            with self.lock:
+                self.building = False
+            return
+        
+        with self.lock:
+            # Catch up with documents added or removed during training
+            for doc_id, segment in snapshot.items():
+                if self.segments.get(doc_id) is not segment:
+                    index.remove(doc_id)
+            index.add_many([(doc_id, segment.matrix, segment.version)
+                            for doc_id, segment in self.segments.items()
+                            if len(segment) and segment is not snapshot.get(doc_id)])
+            
+            self.vector_index = index
+            self.building = False
+            if self.vector_index_path:
+                index.save(self.vector_index_path)
+    
+    def search(self, query_embedding, top_k: int = 5, include_neighbors: bool = True,
+               neighbor_window: int = 1, min_similarity: float = None,
+               document_ids: Iterable[int] = None) -> List[Dict]:
+        """
+        Find the most similar chunks across the corpus.
+        
+        Args:
+            query_embedding: Query embedding vector
+            top_k: Number of hits to retrieve across all searched documents
+            include_neighbors: Whether to add adjacent chunks of each hit
+                (from the same document)
+            neighbor_window: Chunks to include on each side of a hit
+            min_similarity: Optional similarity floor for hits
+            document_ids: Restrict the search to these documents
+        
+        Returns:
+            List of dictionaries containing:
+                - document_id: Source document
+                - chunk_id: Chunk identifier within the document
+                - text: Chunk text content
+                - similarity: Cosine similarity score
+                - token_count: Number of tokens
+            Sorted by similarity score (highest first)
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        
+        vector_index = self._ivf_index() if document_ids is None else None
+        with self.lock:
+            segments = dict(self.segments)
+            if vector_index is not None:
+                hit_docs, hit_rows = vector_index.search(query, top_k, min_similarity)
+        
+        if vector_index is None:
+            # Exact search scores each segment in place; filtered searches
+            # scan only the selected documents
+            doc_ids = [doc_id for doc_id in (segments if document_ids is None else document_ids)
+                       if doc_id in segments and len(segments[doc_id])]
+            if not doc_ids:
+                return []
+            
+            offsets = np.cumsum([0] + [len(segments[doc_id]) for doc_id in doc_ids])
+            scores = np.concatenate([segments[doc_id].matrix @ query for doc_id in doc_ids])
+            top = select_top_k(scores, top_k, min_similarity)
+            owners = np.searchsorted(offsets, top, side='right') - 1
+            hit_docs = np.asarray(doc_ids, dtype=np.int64)[owners]
+            hit_rows = top - offsets[owners]
+        
+        # Group hits by document and resolve neighbors within each segment
+        results = []
+        for doc_id in np.unique(hit_docs).tolist():
+            segment = segments[doc_id]
+            local_rows = hit_rows[hit_docs == doc_id]
+            if include_neighbors:
+                local_rows = segment.expand_neighbors(local_rows, neighbor_window)
+            
+            similarities = segment.matrix[local_rows] @ query
+            for chunk_id, text, similarity, token_count in zip(
+                segment.chunk_ids[local_rows].tolist(),
+                segment.get_texts(local_rows),
+                similarities.tolist(),
+                segment.token_counts[local_rows].tolist()
+            ):
+                results.append({
+                    'document_id': doc_id,
+                    'chunk_id': chunk_id,
+                    'text': text,
+                    'similarity': similarity,
+                    'token_count': token_count
+                })
+        
+        return sorted(results, key=lambda x: x['similarity'], reverse=True)
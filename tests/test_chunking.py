@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import itertools
+import random
+import tiktoken
+import pytest
+from src.embed_and_store import DocumentEmbedder
+
+# One token per byte, so tests need no downloaded encoding and counts are predictable
+BYTE_ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"""\S+|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={}
+)
+
+@pytest.fixture
+def embedder(monkeypatch):
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: BYTE_ENCODING)
+    return DocumentEmbedder(None)
+
+WORDS = itertools.count()
+
+def long_sentence(n_tokens: int) -> str:
+    # Numbered words keep every stretch of text distinct
+    return " ".join(f"{next(WORDS) % 10000:04d}" for _ in range(n_tokens // 5)) + ". "
+
+def test_long_sentences_do_not_repeat_chunks(embedder):
+    # Gaps between sentence boundaries exceed chunk_size - overlap
+    text = "".join(long_sentence(850) for _ in range(5))
+    chunks = embedder.chunk_text(text, chunk_size=1000, overlap=200)
+    
+    # Each chunk advances past the previous one's end (was ~200 chunks shrinking by a token)
+    assert len(chunks) <= 2 * (len(text) // (1000 - 200) + 1)
+    assert all(chunk['token_count'] > 200 for chunk in chunks[:-1])
+    assert len({chunk['text'] for chunk in chunks}) == len(chunks)
+
+def test_short_sentence_before_long_run(embedder):
+    text = "Short sentence. " + "word " * 1500 + "end."
+    chunks = embedder.chunk_text(text, chunk_size=1000, overlap=200)
+    
+    n_tokens = len(text.strip())
+    assert len(chunks) == -(-(n_tokens - 200) // 800)
+    assert all(chunk['token_count'] == 1000 for chunk in chunks[:-1])
+    assert chunks[-1]['text'].endswith("end.")
+
+def test_chunks_cover_text_with_overlap(embedder):
+    text = "".join(long_sentence(n) for n in (850, 120, 1400, 60, 900))
+    chunks = embedder.chunk_text(text, chunk_size=1000, overlap=200)
+    
+    assert chunks[0]['text'] == text[:len(chunks[0]['text'])]
+    assert chunks[-1]['text'] == text.strip()[-len(chunks[-1]['text']):]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk['token_count'] <= 1000
+        assert previous['text'].endswith(chunk['text'][:200].strip())
+
+def test_streaming_matches_whole_text(embedder):
+    pages = [(1, "".join(long_sentence(850) for _ in range(3))),
+             (2, "Short sentence. " + "word " * 1500),
+             (3, long_sentence(400))]
+    text = "".join(f"\n--- Page {number} ---\n{page_text}" for number, page_text in pages)
+    
+    streamed = list(embedder.chunk_pages(pages, chunk_size=1000, overlap=200))
+    assert [chunk['text'] for chunk in streamed] == \
+        [chunk['text'] for chunk in embedder.chunk_text(text, chunk_size=1000, overlap=200)]
+
+def test_streaming_matches_whole_text_with_multibyte_characters(embedder):
+    # Byte tokens split every multibyte character, and '. ' cuts fall
+    # between the period and the space
+    alphabet = ["a", "b", "\u00e9", "\u2014", "\u4e2d", "\U0001f600", " ", ". ", "."]
+    for seed in range(50):
+        rng = random.Random(seed)
+        pages = [(number, "".join(rng.choice(alphabet) for _ in range(rng.randint(50, 900))))
+                 for number in range(1, rng.randint(2, 6))]
+        text = "".join(f"\n--- Page {number} ---\n{page_text}" for number, page_text in pages)
+        
+        streamed = list(embedder.chunk_pages(pages, chunk_size=200, overlap=40))
+        whole = embedder.chunk_text(text, chunk_size=200, overlap=40)
+        assert streamed == whole
+        assert all(chunk['text'] in text for chunk in whole)
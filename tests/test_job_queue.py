@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+import json
+import socket
+import subprocess
+import sys
+import time
+import pytest
+from src.database import DocumentDatabase
+from src.job_queue import JobQueue
+
+@pytest.fixture
+def db(tmp_path):
+    return DocumentDatabase(str(tmp_path / "documents.db"))
+
+@pytest.fixture
+def jobs(db):
+    return JobQueue(db, lease_seconds=60, max_attempts=3)
+
+WORKER = JobQueue.worker_id("test")
+
+def job_rows(db, doc_id=None):
+    with db.connection() as conn:
+        return conn.execute("""
+            SELECT id, status, attempts, priority, sort_key FROM jobs
+            WHERE ? IS NULL OR document_id = ? ORDER BY id
+        """, (doc_id, doc_id)).fetchall()
+
+def expire_leases(db):
+    with db.connection() as conn:
+        conn.execute("UPDATE jobs SET lease_expires_at = 0 WHERE status = 'leased'")
+
+# Leases and attempts
+
+def test_expired_lease_is_reclaimed_and_counts_an_attempt(jobs, db):
+    jobs.put({'document_id': 1})
+    first = jobs.claim(WORKER)
+    assert first['_attempts'] == 1
+    assert jobs.claim(WORKER) is None
+    
+    expire_leases(db)
+    second = jobs.claim(WORKER)
+    assert second['_job_id'] == first['_job_id']
+    assert second['_attempts'] == 2
+    
+    # The first worker lost its lease: it can neither renew nor finish the job
+    assert not jobs.heartbeat(first)
+    jobs.complete(first)
+    assert job_rows(db)[0][1] == 'leased'
+    
+    assert jobs.heartbeat(second)
+    jobs.complete(second)
+    assert job_rows(db)[0][1] == 'done'
+
+def test_heartbeat_keeps_lease_alive(db):
+    jobs = JobQueue(db, lease_seconds=0.2)
+    jobs.put({'document_id': 1})
+    job = jobs.claim(WORKER)
+    
+    for _ in range(3):
+        time.sleep(0.1)
+        assert jobs.heartbeat(job)
+    assert jobs.claim(WORKER) is None
+    
+    time.sleep(0.3)
+    assert jobs.claim(WORKER)['_attempts'] == 2
+
+def test_release_requeues_until_max_attempts(jobs, db):
+    jobs.put({'document_id': 1})
+    
+    for attempt in (1, 2):
+        job = jobs.claim(WORKER)
+        assert job['_attempts'] == attempt
+        jobs.release(job, "transient")
+        assert job_rows(db)[0][1] == 'queued'
+    
+    job = jobs.claim(WORKER)
+    jobs.release(job, "transient")
+    assert job_rows(db)[0][1] == 'failed'
+    assert jobs.claim(WORKER) is None
+    assert jobs.get_stats()['jobs_failed'] == 1
+
+def test_release_without_counting_the_attempt(jobs, db):
+    jobs.put({'document_id': 1})
+    for _ in range(jobs.max_attempts + 1):
+        jobs.release(jobs.claim(WORKER), "shutdown", count_attempt=False)
+    
+    assert job_rows(db)[0][1:3] == ('queued', 0)
+    assert jobs.claim(WORKER)['_attempts'] == 1
+
+def test_expired_leases_past_max_attempts_are_reported(jobs, db):
+    jobs.put({'document_id': 1})
+    for _ in range(jobs.max_attempts + 1):
+        job = jobs.claim(WORKER)
+        expire_leases(db)
+    
+    # Callers fail jobs whose workers kept dying
+    assert job['_attempts'] > jobs.max_attempts
+    jobs.fail(job, "abandoned")
+    assert job_rows(db)[0][1] == 'failed'
+    assert jobs.claim(WORKER) is None
+
+def test_release_orphans_expires_leases_of_exited_processes(jobs, db):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    
+    jobs.put({'document_id': 1})
+    jobs.put({'document_id': 2})
+    jobs.claim(WORKER)
+    jobs.claim(WORKER)
+    with db.connection() as conn:
+        conn.execute("UPDATE jobs SET lease_owner = ? WHERE document_id = 1",
+                     (f"{socket.gethostname()}:{exited.pid}:deadbeef:Worker-0",))
+    
+    # Only the dead process's lease is released; this process's is kept
+    assert jobs.release_orphans() == 1
+    reclaimed = jobs.claim(WORKER)
+    assert reclaimed['document_id'] == 1
+    assert reclaimed['_attempts'] == 2
+
+def test_legacy_rows_are_backfilled(db):
+    with db.connection() as conn:
+        conn.execute("""
+            CREATE TABLE jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_id INTEGER,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_token TEXT,
+                lease_expires_at REAL,
+                enqueued_at REAL NOT NULL,
+                finished_at REAL,
+                last_error TEXT
+            )
+        """)
+        conn.execute("INSERT INTO jobs (document_id, payload, enqueued_at) VALUES (?, ?, ?)",
+                     (1, json.dumps({'document_id': 1}), 1000.0))
+    
+    jobs = JobQueue(db)
+    assert job_rows(db) == [(1, 'queued', 0, 'bulk', 1000.0)]
+    
+    # Still first in line ahead of newer (even interactive) jobs
+    jobs.put({'document_id': 2}, priority='interactive')
+    job = jobs.claim(WORKER)
+    assert job['document_id'] == 1
+    assert job['_priority'] == 'bulk'
+    assert jobs.claim(WORKER, priorities=['bulk']) is None
+
+def test_prune_deletes_only_finished_jobs(jobs, db):
+    for doc_id in (1, 2, 3):
+        jobs.put({'document_id': doc_id})
+    jobs.complete(jobs.claim(WORKER))
+    jobs.fail(jobs.claim(WORKER), "broken")
+    
+    assert jobs.prune(retention_seconds=3600) == 0
+    assert jobs.prune(retention_seconds=0) == 2
+    assert [row[1] for row in job_rows(db)] == ['queued']
+
+# Coalescing and cancellation
+
+def test_duplicate_put_moves_queued_job_earlier(jobs, db):
+    first = jobs.put({'document_id': 1}, priority='bulk', size=100)
+    (_, _, _, _, bulk_key), = job_rows(db, 1)
+    
+    assert jobs.put({'document_id': 1}, priority='interactive') == first
+    (_, status, _, priority, sort_key), = job_rows(db, 1)
+    assert (status, priority) == ('queued', 'interactive')
+    assert sort_key < bulk_key
+    
+    # A later request never pushes the job back
+    assert jobs.put({'document_id': 1}, priority='bulk', size=100) == first
+    assert job_rows(db, 1) == [(first, 'queued', 0, 'interactive', sort_key)]
+
+def test_duplicate_put_on_running_job_does_not_requeue(jobs, db):
+    job_id = jobs.put({'document_id': 1})
+    job = jobs.claim(WORKER)
+    
+    assert jobs.put({'document_id': 1}, priority='interactive') == job_id
+    assert job_rows(db, 1) == [(job_id, 'leased', 1, 'bulk', job['_sort_key'])]
+    assert jobs.claim(WORKER) is None
+    
+    # Once finished, a new request does get a new job
+    jobs.complete(job)
+    assert jobs.put({'document_id': 1}) != job_id
+
+def test_cancel_only_removes_queued_jobs(jobs, db):
+    jobs.put({'document_id': 1})
+    jobs.put({'document_id': 2})
+    assert jobs.claim(WORKER)['document_id'] == 1
+    
+    assert jobs.cancel_document(1) == 0
+    assert jobs.cancel_document(2) == 1
+    assert [row[1] for row in job_rows(db, 1)] == ['leased']
+    assert job_rows(db, 2) == []
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import random
+import time
+import numpy as np
+import pytest
+import tiktoken
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+import config
+from src.background_processor import BackgroundProcessor
+from src.database import DocumentDatabase
+from tests.test_chunking import BYTE_ENCODING
+
+class _Embedding:
+    def __init__(self, index, embedding):
+        self.index = index
+        self.embedding = embedding
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+class SlowEmbeddings:
+    """Stands in for client.embeddings; requests finish in random order."""
+    def create(self, model, input):
+        time.sleep(random.uniform(0, 0.05))
+        return _Response([_Embedding(i, np.random.default_rng(i).standard_normal(8).tolist())
+                          for i in range(len(input))])
+
+def write_pdf(path, n_pages=8):
+    pdf = canvas.Canvas(str(path), pagesize=letter)
+    for page in range(n_pages):
+        for line in range(40):
+            words = " ".join(f"p{page}l{line}w{word}" for word in range(8))
+            pdf.drawString(40, 750 - 18 * line, f"{words}.")
+        pdf.showPage()
+    pdf.save()
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: BYTE_ENCODING)
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(config, "EMBEDDING_STORAGE", "memmap")
+    monkeypatch.setattr(config, "EMBEDDING_BATCH_SIZE", 2)
+    
+    processor = BackgroundProcessor()
+    processor.embedder.client.embeddings = SlowEmbeddings()
+    yield processor
+    processor.stop()
+
+def wait_until_finished(processor, doc_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        doc = processor.get_document_status(doc_id)
+        if doc['status'] in ('completed', 'failed'):
+            return doc
+        time.sleep(0.1)
+    raise TimeoutError(f"Document {doc_id} still {doc['status']}")
+
+def test_pipelined_ingest_keeps_sidecar_rows_in_chunk_order(processor, tmp_path):
+    write_pdf(tmp_path / "doc.pdf")
+    doc_id = processor.queue_document(str(tmp_path / "doc.pdf"))
+    
+    doc = wait_until_finished(processor, doc_id)
+    assert doc['status'] == 'completed', doc.get('error_message')
+    assert doc['total_chunks'] >= 4 * config.EMBEDDING_BATCH_SIZE
+    
+    # Windows embedded out of order are still written in order, so the
+    # document's rows are one slice of its sidecar file
+    arrays = processor.db.get_chunk_arrays(doc_id, ['embedding'])
+    assert isinstance(arrays['embedding'], np.memmap)
+    assert arrays['has_embedding'].all()
+
+def test_stop_releases_documents_in_flight(processor, tmp_path):
+    write_pdf(tmp_path / "doc.pdf", n_pages=40)
+    doc_id = processor.queue_document(str(tmp_path / "doc.pdf"))
+    
+    deadline = time.time() + 60
+    while not processor.get_document_status(doc_id)['total_chunks'] and time.time() < deadline:
+        time.sleep(0.01)
+    processor.stop()
+    assert not any(thread.is_alive() for thread in processor.workers + processor.stage_threads)
+    
+    # The job is back in the queue without using up an attempt, and nothing
+    # was written after its lease was given up
+    doc = processor.get_document_status(doc_id)
+    assert doc['status'] == 'pending'
+    with processor.db.connection() as conn:
+        jobs = conn.execute("SELECT status, attempts, lease_token FROM jobs WHERE document_id = ?",
+                            (doc_id,)).fetchall()
+    assert jobs == [('queued', 0, None)]
+    assert len(processor.db.get_embedded_chunk_ids(doc_id)) == doc['total_chunks'] < 150
+
+def test_corpus_index_follows_other_processes(processor, monkeypatch):
+    monkeypatch.setattr(config, "CORPUS_SYNC_INTERVAL", 0)
+    corpus = processor.get_corpus_index()
+    assert len(corpus) == 0
+    
+    # Another process (e.g. bulk_ingest) completes, reprocesses and deletes a document
+    other = DocumentDatabase("documents.db")
+    doc_id = other.add_document("other.pdf", "other.pdf", 0, 1, "other")
+    other.add_chunks(doc_id, [{'chunk_id': i, 'text': f"chunk {i}", 'token_count': 2,
+                               'embedding': np.ones(8)} for i in range(3)])
+    other.update_document_status(doc_id, 'completed')
+    assert processor.get_corpus_index() is corpus
+    assert doc_id in corpus and len(corpus) == 3
+    
+    other.update_document_status(doc_id, 'completed')
+    processor.get_corpus_index()
+    assert corpus.get_segment(doc_id).version == other.get_document_by_id(doc_id)['revision']
+    
+    other.delete_document(doc_id)
+    processor.get_corpus_index()
+    assert doc_id not in corpus and len(corpus) == 0
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import threading
+import numpy as np
+import config
+from src.retrieval_index import CorpusIndex, RetrievalIndex
+from src.vector_index import SegmentedIVF
+
+def make_segment(rng, n_rows, dim=16):
+    matrix = rng.standard_normal((n_rows, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    texts = np.array([f"chunk {i}" for i in range(n_rows)], dtype=object)
+    return RetrievalIndex(np.arange(n_rows), matrix, texts, np.ones(n_rows, dtype=np.int64), version=1)
+
+def test_ivf_trains_in_background_while_search_stays_exact(monkeypatch):
+    monkeypatch.setattr(config, "VECTOR_INDEX_BACKEND", "ivf")
+    monkeypatch.setattr(config, "IVF_MIN_VECTORS", 100)
+    
+    # Hold training until the test lets it finish
+    release = threading.Event()
+    train = SegmentedIVF.train
+    def slow_train(segments, *args, **kwargs):
+        release.wait(10)
+        return train(segments, *args, **kwargs)
+    monkeypatch.setattr(SegmentedIVF, "train", slow_train)
+    
+    rng = np.random.default_rng(0)
+    corpus = CorpusIndex()
+    for doc_id in range(4):
+        corpus.add_document(doc_id, make_segment(rng, 100))
+    query = corpus.get_segment(2).matrix[7]
+    
+    # The search that starts training is answered exactly, without waiting
+    hits = corpus.search(query, top_k=1, include_neighbors=False)
+    assert (hits[0]['document_id'], hits[0]['chunk_id']) == (2, 7)
+    assert corpus.building and corpus.vector_index is None
+    
+    # Documents added during training are caught up before the swap
+    corpus.add_document(4, make_segment(rng, 50))
+    release.set()
+    corpus.build_thread.join(10)
+    assert not corpus.building
+    assert len(corpus.vector_index) == 450
+    
+    hits = corpus.search(query, top_k=1, include_neighbors=False)
+    assert (hits[0]['document_id'], hits[0]['chunk_id']) == (2, 7)